@@ -0,0 +1,34 @@
+"""add live scoreboard
+
+Revision ID: 08ecff3af8af
+Revises: 756e25cd2f03
+Create Date: 2026-10-18 19:03:27.114682
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "08ecff3af8af"
+down_revision: Union[str, None] = "756e25cd2f03"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "live_scoreboard",
+        sa.Column("chat_id", sa.BigInteger(), nullable=False),
+        sa.Column("message_id", sa.BigInteger(), nullable=False),
+        sa.Column("owner", sa.BigInteger(), nullable=False),
+        sa.Column("last_rendered_hash", sa.String(), nullable=True),
+        sa.Column("next_due", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("chat_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("live_scoreboard")
@@ -0,0 +1,102 @@
+"""add lookup indexes
+
+Revision ID: 1a0a6079447f
+Revises: 499dfb1fa923
+Create Date: 2026-10-18 12:04:31.208411
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "1a0a6079447f"
+down_revision: Union[str, None] = "499dfb1fa923"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The select-then-insert in the handlers and the middleware could race and
+    # leave duplicate rows behind. Keep the oldest row of every duplicate set,
+    # but carry over flags that were set on any of its copies.
+    op.execute(
+        """
+        UPDATE group_user AS kept
+        SET is_banned = TRUE
+        WHERE EXISTS (
+            SELECT 1 FROM group_user AS dup
+            WHERE dup.group_id = kept.group_id
+              AND dup.user_id = kept.user_id
+              AND dup.id <> kept.id
+              AND dup.is_banned
+        )
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM group_user AS dup
+        USING group_user AS kept
+        WHERE dup.group_id = kept.group_id
+          AND dup.user_id = kept.user_id
+          AND dup.id > kept.id
+        """
+    )
+    op.execute(
+        """
+        UPDATE "group" AS kept
+        SET autodelete = TRUE
+        WHERE EXISTS (
+            SELECT 1 FROM "group" AS dup
+            WHERE dup.group_id = kept.group_id
+              AND dup.id <> kept.id
+              AND dup.autodelete
+        )
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM "group" AS dup
+        USING "group" AS kept
+        WHERE dup.group_id = kept.group_id
+          AND dup.id > kept.id
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM users AS dup
+        USING users AS kept
+        WHERE dup.user_id = kept.user_id
+          AND dup.id > kept.id
+        """
+    )
+
+    op.create_index("ux_users_user_id", "users", ["user_id"], unique=True)
+    op.create_index("ix_users_streak", "users", ["streak", "user_id"])
+    op.create_index("ix_users_username_lower", "users", [sa.text("lower(username)")])
+    op.create_index("ux_group_group_id", "group", ["group_id"], unique=True)
+    op.create_index(
+        "ux_group_user_group_id_user_id",
+        "group_user",
+        ["group_id", "user_id"],
+        unique=True,
+    )
+    op.create_index("ix_group_user_user_id", "group_user", ["user_id"])
+    op.create_index(
+        "ix_group_user_scoreboard",
+        "group_user",
+        ["group_id", "user_id"],
+        postgresql_where=sa.text("is_banned = false"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_group_user_scoreboard", table_name="group_user")
+    op.drop_index("ix_group_user_user_id", table_name="group_user")
+    op.drop_index("ux_group_user_group_id_user_id", table_name="group_user")
+    op.drop_index("ux_group_group_id", table_name="group")
+    op.drop_index("ix_users_username_lower", table_name="users")
+    op.drop_index("ix_users_streak", table_name="users")
+    op.drop_index("ux_users_user_id", table_name="users")
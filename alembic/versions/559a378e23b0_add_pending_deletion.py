@@ -0,0 +1,35 @@
+"""add pending deletion
+
+Revision ID: 559a378e23b0
+Revises: 1a0a6079447f
+Create Date: 2026-10-18 13:21:47.730152
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "559a378e23b0"
+down_revision: Union[str, None] = "1a0a6079447f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "pending_deletion",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("chat_id", sa.BigInteger(), nullable=False),
+        sa.Column("message_id", sa.BigInteger(), nullable=False),
+        sa.Column("due_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_pending_deletion_due_at", "pending_deletion", ["due_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_pending_deletion_due_at", table_name="pending_deletion")
+    op.drop_table("pending_deletion")
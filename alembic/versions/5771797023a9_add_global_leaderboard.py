@@ -0,0 +1,47 @@
+"""add global leaderboard
+
+Revision ID: 5771797023a9
+Revises: 559a378e23b0
+Create Date: 2026-10-18 15:02:13.482096
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5771797023a9"
+down_revision: Union[str, None] = "559a378e23b0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "global_leaderboard",
+        sa.Column("user_id", sa.BigInteger(), nullable=False),
+        sa.Column("streak", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.create_index(
+        "ix_global_leaderboard_streak", "global_leaderboard", ["streak", "user_id"]
+    )
+    op.execute(
+        """
+        INSERT INTO global_leaderboard (user_id, streak)
+        SELECT users.user_id, users.streak
+        FROM users
+        WHERE EXISTS (
+            SELECT 1 FROM group_user
+            WHERE group_user.user_id = users.user_id
+              AND group_user.is_banned = false
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_global_leaderboard_streak", table_name="global_leaderboard")
+    op.drop_table("global_leaderboard")
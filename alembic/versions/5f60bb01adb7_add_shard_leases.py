@@ -0,0 +1,39 @@
+"""add shard leases
+
+Revision ID: 5f60bb01adb7
+Revises: 08ecff3af8af
+Create Date: 2026-10-18 20:41:09.532871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5f60bb01adb7"
+down_revision: Union[str, None] = "08ecff3af8af"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "cluster_member",
+        sa.Column("instance_id", sa.String(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("instance_id"),
+    )
+    op.create_table(
+        "shard_lease",
+        sa.Column("shard", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("owner", sa.String(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("shard"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("shard_lease")
+    op.drop_table("cluster_member")
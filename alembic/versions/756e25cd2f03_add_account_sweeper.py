@@ -0,0 +1,60 @@
+"""add account sweeper
+
+Revision ID: 756e25cd2f03
+Revises: d98d648093eb
+Create Date: 2026-10-18 17:12:40.508213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "756e25cd2f03"
+down_revision: Union[str, None] = "d98d648093eb"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "group_user",
+        sa.Column(
+            "has_left",
+            sa.Boolean,
+            default=False,
+            nullable=False,
+            server_default=sa.text("FALSE"),
+        ),
+    )
+    op.drop_index("ix_group_user_scoreboard", table_name="group_user")
+    op.create_index(
+        "ix_group_user_scoreboard",
+        "group_user",
+        ["group_id", "user_id"],
+        postgresql_where=sa.text("is_banned = false AND has_left = false"),
+        sqlite_where=sa.text("is_banned = false AND has_left = false"),
+    )
+    op.create_table(
+        "job_checkpoint",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("group_id", sa.BigInteger(), nullable=True),
+        sa.Column("user_id", sa.BigInteger(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("job_checkpoint")
+    op.drop_index("ix_group_user_scoreboard", table_name="group_user")
+    op.create_index(
+        "ix_group_user_scoreboard",
+        "group_user",
+        ["group_id", "user_id"],
+        postgresql_where=sa.text("is_banned = false"),
+        sqlite_where=sa.text("is_banned = false"),
+    )
+    op.drop_column("group_user", "has_left")
@@ -0,0 +1,54 @@
+"""add relapse history
+
+Revision ID: d98d648093eb
+Revises: 5771797023a9
+Create Date: 2026-10-18 16:37:52.114590
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d98d648093eb"
+down_revision: Union[str, None] = "5771797023a9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "relapse_event",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.BigInteger(), nullable=False),
+        sa.Column("streak_started", sa.DateTime(), nullable=False),
+        sa.Column("relapsed_at", sa.DateTime(), nullable=False),
+        sa.Column("days", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_relapse_event_user_id_relapsed_at",
+        "relapse_event",
+        ["user_id", "relapsed_at"],
+    )
+    op.create_table(
+        "user_stats",
+        sa.Column("user_id", sa.BigInteger(), nullable=False),
+        sa.Column("tracking_since", sa.DateTime(), nullable=False),
+        sa.Column("relapses", sa.Integer(), nullable=False),
+        sa.Column("total_days", sa.BigInteger(), nullable=False),
+        sa.Column("longest_streak", sa.Integer(), nullable=False),
+        sa.Column("last_relapse_at", sa.DateTime(), nullable=False),
+        sa.Column("window_start", sa.DateTime(), nullable=False),
+        sa.Column("window_relapses", sa.Integer(), nullable=False),
+        sa.Column("previous_window_relapses", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_stats")
+    op.drop_index("ix_relapse_event_user_id_relapsed_at", table_name="relapse_event")
+    op.drop_table("relapse_event")
@@ -0,0 +1,48 @@
+"""add milestone notifications
+
+Revision ID: df067ee11899
+Revises: 5f60bb01adb7
+Create Date: 2026-10-18 22:12:47.105238
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "df067ee11899"
+down_revision: Union[str, None] = "5f60bb01adb7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "group",
+        sa.Column(
+            "milestones", sa.Boolean(), server_default=sa.false(), nullable=False
+        ),
+    )
+    op.add_column(
+        "users",
+        sa.Column(
+            "milestones", sa.Boolean(), server_default=sa.false(), nullable=False
+        ),
+    )
+    op.create_table(
+        "milestone_notification",
+        sa.Column("chat_id", sa.BigInteger(), nullable=False),
+        sa.Column("user_id", sa.BigInteger(), nullable=False),
+        sa.Column("streak", sa.DateTime(), nullable=False),
+        sa.Column("milestone", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("sent_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("chat_id", "user_id", "streak", "milestone"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("milestone_notification")
+    op.drop_column("users", "milestones")
+    op.drop_column("group", "milestones")
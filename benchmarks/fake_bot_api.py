@@ -0,0 +1,86 @@
+"""A stand-in for the Telegram Bot API that answers every method locally.
+
+Point the bot at it with `TelegramAPIServer.from_base(server.url)` (or
+TELEGRAM_API_URL). Every call is counted per method in `calls`.
+"""
+import itertools
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+BOT_ID = 1
+ADMIN_ID = 2
+
+
+def make_user(user_id: int, is_bot: bool = False) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": is_bot, "first_name": f"User {user_id}"}
+
+
+def make_chat(chat_id: int) -> Dict[str, Any]:
+    if chat_id > 0:
+        return {"id": chat_id, "type": "private", "first_name": f"User {chat_id}"}
+    return {"id": chat_id, "type": "supergroup", "title": f"Group {chat_id}"}
+
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1_000_000)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Port 0 picks a free port.
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = await request.post()
+        self.calls[method] += 1
+        return web.json_response({"ok": True, "result": self.respond(method, data)})
+
+    def respond(self, method: str, data: Any) -> Any:
+        method = method.lower()
+        if method == "getme":
+            return {**make_user(BOT_ID, is_bot=True), "username": "benchmark_bot"}
+        if method in ("sendmessage", "editmessagetext"):
+            return {
+                "message_id": int(data.get("message_id") or next(self._message_ids)),
+                "date": int(time.time()),
+                "chat": make_chat(int(data["chat_id"])),
+                "from": make_user(BOT_ID, is_bot=True),
+                "text": data.get("text", ""),
+            }
+        if method == "getchatadministrators":
+            return [
+                {
+                    "status": "creator",
+                    "user": make_user(ADMIN_ID),
+                    "is_anonymous": False,
+                }
+            ]
+        if method == "getchatmember":
+            return {"status": "member", "user": make_user(int(data["user_id"]))}
+        if method == "getupdates":
+            return []
+        return True
@@ -0,0 +1,111 @@
+"""Measures connection checkout latency of the pool profiles under load.
+
+    $ python benchmarks/pool_checkout.py --profiles direct null \\
+        --concurrency 50 --iterations 200 --hold-ms 5
+
+Every task checks a connection out, runs `SELECT 1`, keeps the connection
+for `--hold-ms` (a handler doing its work) and returns it, `--iterations`
+times. Uses DATABASE_URL and the DATABASE_POOL_* settings, only the
+profile is taken from the command line. The pgbouncer profile needs
+DATABASE_URL to point at PgBouncer.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Any, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from sqlalchemy import event, text
+
+from consts import (
+    DATABASE_MAX_OVERFLOW,
+    DATABASE_POOL_PRE_PING,
+    DATABASE_POOL_RECYCLE_IN_SECONDS,
+    DATABASE_POOL_SIZE,
+    DATABASE_POOL_TIMEOUT_IN_SECONDS,
+    DATABASE_URL,
+)
+from models.engine import PoolProfile, create_engine
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def measure(profile: PoolProfile, args: argparse.Namespace) -> None:
+    engine = create_engine(
+        DATABASE_URL,
+        profile=profile,
+        pool_size=DATABASE_POOL_SIZE,
+        max_overflow=DATABASE_MAX_OVERFLOW,
+        pool_timeout=DATABASE_POOL_TIMEOUT_IN_SECONDS,
+        pool_recycle=DATABASE_POOL_RECYCLE_IN_SECONDS,
+        pool_pre_ping=DATABASE_POOL_PRE_PING,
+    )
+    connects = 0
+
+    def count_connect(*_: Any) -> None:
+        nonlocal connects
+        connects += 1
+
+    event.listen(engine.sync_engine, "connect", count_connect)
+    waits: List[float] = []
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            try:
+                async with engine.connect() as conn:
+                    waits.append(time.perf_counter() - started)
+                    await conn.execute(text("SELECT 1"))
+                    await asyncio.sleep(args.hold_ms / 1000)
+            except Exception:
+                errors += 1
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await engine.dispose()
+
+    waits.sort()
+    print(
+        f"{profile.value:<12}"
+        + "".join(
+            f"{percentile(waits, fraction) * 1000:>9.2f}"
+            for fraction in (0.5, 0.95, 0.99)
+        )
+        + f"{waits[-1] * 1000:>9.2f}"
+        + f"{len(waits) / elapsed:>10.0f}"
+        + f"{connects:>10}"
+        + f"{errors:>8}"
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    print(
+        f"{'profile':<12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+        f"{'ops/s':>10}{'connects':>10}{'errors':>8}"
+    )
+    for profile in args.profiles:
+        await measure(PoolProfile(profile), args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        choices=[profile.value for profile in PoolProfile],
+        default=[PoolProfile.DIRECT.value, PoolProfile.NULL.value],
+    )
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--hold-ms", type=float, default=5)
+    asyncio.run(run(parser.parse_args()))
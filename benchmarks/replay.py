@@ -0,0 +1,252 @@
+"""Replays a synthetic update stream through the real dispatcher, offline.
+
+    $ python benchmarks/replay.py --updates 5000 --users 500 --groups 20
+
+Updates go through `dp.feed_update` with all middlewares, one at a time,
+against the database configured for the bot and a local fake Bot API
+server, so no network is needed. Use a scratch database: the synthetic
+users and groups are removed before and after the run.
+
+For every kind of update it reports p50/p95/p99 latency, SQL queries per
+update and Bot API calls per update. The outbound limiter is not
+installed, its sleeps would dominate the numbers.
+"""
+import argparse
+import asyncio
+import functools
+import itertools
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+from kink import di
+from sqlalchemy import delete, event
+
+import main
+from consts import TIMEOUT_SCOREBOARD_IN_SECONDS
+from fake_bot_api import ADMIN_ID, BOT_ID, FakeBotAPI, make_chat, make_user
+from models.database import Group, LiveScoreboard, PendingDeletion
+from models.repository import delete_users
+from models.schema import prepare_schema
+from services.autodelete import DeletionQueue
+from services.leaderboard import GlobalRanking
+from services.scoreboards import ScoreboardScheduler
+
+# Far above real Telegram ids, so the run can't touch real users.
+FIRST_USER_ID = 9_000_000_000_000
+FIRST_CHAT_ID = -9_000_000_000_000
+
+# (kind, weight) of the steady-state mix after everybody registered.
+MIX = [
+    ("chatter", 60),
+    ("/streak", 8),
+    ("/stats", 8),
+    ("/relapse", 4),
+    ("relapse button", 4),
+    ("/setstreak", 3),
+    ("/top", 3),
+    ("/history", 3),
+    ("/removeFromLeaderboard", 1),
+    ("/returnToLeaderboard", 1),
+]
+CHATTER = ["hello", "how is everyone doing?", "nice streak!", "day 3, going strong"]
+
+
+class Stream:
+    def __init__(self, users: int, groups: int, seed: int) -> None:
+        self.random = random.Random(seed)
+        self.user_ids = [FIRST_USER_ID + i for i in range(users)]
+        self.chat_ids = [FIRST_CHAT_ID - i for i in range(groups)]
+        self.home = {
+            user_id: self.chat_ids[i % groups]
+            for i, user_id in enumerate(self.user_ids)
+        }
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def message(self, user_id: int, chat_id: int, text: str) -> Dict[str, Any]:
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": make_chat(chat_id),
+                "from": make_user(user_id),
+                "text": text,
+            },
+        }
+
+    def callback(self, user_id: int, chat_id: int, data: str) -> Dict[str, Any]:
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": make_user(user_id),
+                "chat_instance": str(chat_id),
+                "data": data,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": make_chat(chat_id),
+                    "from": make_user(BOT_ID, is_bot=True),
+                    "text": "",
+                },
+            },
+        }
+
+    def setup(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Everybody starts a streak and joins their group's scoreboard, and
+        every group turns a message into a live scoreboard."""
+        for user_id in self.user_ids:
+            chat_id = self.home[user_id]
+            yield "/streak (new user)", self.message(user_id, chat_id, "/streak")
+            yield "/enablescoreboard", self.message(
+                user_id, chat_id, "/enablescoreboard"
+            )
+        for chat_id in self.chat_ids:
+            user_id = next(u for u in self.user_ids if self.home[u] == chat_id)
+            yield "turn button", self.callback(user_id, chat_id, f"turn_{user_id}")
+
+    def mix(self, count: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        kinds, weights = zip(*MIX)
+        for kind in self.random.choices(kinds, weights, k=count):
+            user_id = self.random.choice(self.user_ids)
+            chat_id = self.home[user_id]
+            if kind == "chatter":
+                text = self.random.choice(CHATTER)
+            elif kind == "relapse button":
+                # Buttons without an attempt number are never stale.
+                yield kind, self.callback(user_id, chat_id, f"relapse_{user_id}")
+                continue
+            elif kind == "/setstreak":
+                text = f"/setstreak {self.random.randint(0, 365)}"
+            elif kind in ("/removeFromLeaderboard", "/returnToLeaderboard"):
+                yield kind, self.message(ADMIN_ID, chat_id, f"{kind} {user_id}")
+                continue
+            else:
+                text = kind
+            yield kind, self.message(user_id, chat_id, text)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def cleanup(stream: Stream) -> None:
+    async with di["async_session"]() as session:
+        await delete_users(session, stream.user_ids)
+        await session.execute(delete(Group).where(Group.group_id.in_(stream.chat_ids)))
+        await session.execute(
+            delete(PendingDeletion).where(PendingDeletion.chat_id.in_(stream.chat_ids))
+        )
+        await session.execute(
+            delete(LiveScoreboard).where(LiveScoreboard.chat_id.in_(stream.chat_ids))
+        )
+        await session.commit()
+
+
+async def run(args: argparse.Namespace) -> None:
+    queries = 0
+
+    def count_query(*_: Any) -> None:
+        nonlocal queries
+        queries += 1
+
+    event.listen(di["engine"].sync_engine, "before_cursor_execute", count_query)
+
+    api = FakeBotAPI()
+    await api.start()
+    bot = Bot(
+        "123456:benchmark",
+        parse_mode="HTML",
+        session=AiohttpSession(api=TelegramAPIServer.from_base(api.url)),
+    )
+    stream = Stream(args.users, args.groups, args.seed)
+
+    await prepare_schema(di["engine"])
+    await cleanup(stream)
+    di["global_ranking"] = GlobalRanking()
+    async with di["async_session"]() as session:
+        await di["global_ranking"].load(session)
+    # Not started: scoreboards are rendered explicitly below, so background
+    # refreshes don't leak into the numbers of other updates.
+    di["scoreboard_scheduler"] = ScoreboardScheduler(
+        refresh=functools.partial(main.scoreboard, bot),
+        interval=TIMEOUT_SCOREBOARD_IN_SECONDS,
+    )
+    di["deletion_queue"] = DeletionQueue(bot, delay=0)
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    query_counts: Dict[str, int] = defaultdict(int)
+    api_counts: Dict[str, int] = defaultdict(int)
+    errors: Dict[str, int] = defaultdict(int)
+
+    async def measure(kind: str, call) -> None:
+        queries_before, calls_before = queries, api.total_calls()
+        started = time.perf_counter()
+        try:
+            await call()
+        except Exception:
+            errors[kind] += 1
+        latencies[kind].append(time.perf_counter() - started)
+        query_counts[kind] += queries - queries_before
+        api_counts[kind] += api.total_calls() - calls_before
+
+    updates = itertools.chain(stream.setup(), stream.mix(args.updates))
+    started = time.perf_counter()
+    total = 0
+    try:
+        for kind, update in updates:
+            await measure(
+                kind, functools.partial(main.dp.feed_update, bot, Update(**update))
+            )
+            total += 1
+        for chat_id in stream.chat_ids:
+            await measure(
+                "scoreboard refresh",
+                functools.partial(main.scoreboard, bot, chat_id, 1),
+            )
+        elapsed = time.perf_counter() - started
+    finally:
+        await cleanup(stream)
+        await bot.session.close()
+        await api.stop()
+        await di["engine"].dispose()
+
+    print(f"updates:    {total} in {elapsed:.2f}s")
+    print(f"throughput: {total / elapsed:.1f} updates/s")
+    print()
+    print(
+        f"{'kind':<26}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        f"{'queries':>9}{'api':>7}{'errors':>8}"
+    )
+    for kind, values in latencies.items():
+        values.sort()
+        print(
+            f"{kind:<26}{len(values):>7}"
+            + "".join(
+                f"{percentile(values, fraction) * 1000:>9.2f}"
+                for fraction in (0.5, 0.95, 0.99)
+            )
+            + f"{query_counts[kind] / len(values):>9.2f}"
+            + f"{api_counts[kind] / len(values):>7.2f}"
+            + f"{errors[kind]:>8}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,78 @@
+"""Plays Telegram against a bot running with RUN_MODE=webhook.
+
+    $ python benchmarks/webhook_load.py --url http://localhost:8080/webhook \
+        --secret "$WEBHOOK_SECRET" --updates 5000 --concurrency 100
+
+Reports how fast the webhook acknowledges updates. Handlers keep running in
+the background after the 200 response, so this measures ingestion only.
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import statistics
+import time
+
+import aiohttp
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+TEXTS = ["/streak", "/stats", "hello", "how is everyone doing?", "nice streak!"]
+
+
+def make_update(update_id: int, chats: int) -> dict:
+    user_id = random.randint(1, 10_000)
+    chat_id = -1_000_000_000_000 - random.randint(1, chats)
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": "Benchmark"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+            "text": random.choice(TEXTS),
+        },
+    }
+
+
+def percentile(values: list, fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def main(args: argparse.Namespace) -> None:
+    headers = {SECRET_TOKEN_HEADER: args.secret} if args.secret else {}
+    update_ids = itertools.count(1)
+    latencies = []
+    statuses = {}
+
+    async def worker(session: aiohttp.ClientSession) -> None:
+        while (update_id := next(update_ids)) <= args.updates:
+            started = time.perf_counter()
+            async with session.post(
+                args.url, json=make_update(update_id, args.chats), headers=headers
+            ) as response:
+                await response.read()
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(worker(session) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"updates:    {len(latencies)} in {elapsed:.2f}s")
+    print(f"throughput: {len(latencies) / elapsed:.1f} updates/s")
+    print(f"statuses:   {statuses}")
+    print(f"mean:       {statistics.mean(latencies) * 1000:.2f} ms")
+    for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        print(f"{name}:        {percentile(latencies, fraction) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--url", default="http://localhost:8080/webhook")
+    parser.add_argument("--secret", default=None)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--chats", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -1,5 +1,6 @@
 from enum import Enum
 import os
+import socket
 
 from dotenv import find_dotenv, load_dotenv
 
@@ -8,13 +9,73 @@ POSTGRES_LOGIN = os.getenv("POSTGRES_LOGIN")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 POSTGRES_HOST = os.getenv("POSTGRES_HOST")
 POSTGRES_DB = os.getenv("POSTGRES_DB")
+# postgresql+asyncpg://... or sqlite+aiosqlite:///path/to/streak.db. Built
+# from POSTGRES_* by default.
+DATABASE_URL = (
+    os.getenv("DATABASE_URL")
+    or f"postgresql+asyncpg://{POSTGRES_LOGIN}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}/{POSTGRES_DB}"
+)
+# "direct", "pgbouncer" (transaction mode) or "null".
+DATABASE_POOL = os.getenv("DATABASE_POOL") or "direct"
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE") or 10)
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW") or 10)
+DATABASE_POOL_TIMEOUT_IN_SECONDS = float(
+    os.getenv("DATABASE_POOL_TIMEOUT_IN_SECONDS") or 30
+)
+DATABASE_POOL_RECYCLE_IN_SECONDS = int(
+    os.getenv("DATABASE_POOL_RECYCLE_IN_SECONDS") or -1
+)
+DATABASE_POOL_PRE_PING = (
+    True if os.getenv("DATABASE_POOL_PRE_PING") == "true" else False
+)
 SQLALCHEMY_ECHO = True if os.getenv("SQLALCHEMY_ECHO") == "true" else False
 TIMEOUT_SCOREBOARD_IN_SECONDS = int(os.getenv("TIMEOUT_SCOREBOARD_IN_SECONDS") or 180)
+SCOREBOARD_WORKERS = int(os.getenv("SCOREBOARD_WORKERS") or 4)
+SCOREBOARD_PAGE_SIZE = int(os.getenv("SCOREBOARD_PAGE_SIZE") or 50)
+GLOBAL_TOP_SIZE = int(os.getenv("GLOBAL_TOP_SIZE") or 10)
+HISTORY_SIZE = int(os.getenv("HISTORY_SIZE") or 10)
+AUTODELETE_DELAY_IN_SECONDS = int(os.getenv("AUTODELETE_DELAY_IN_SECONDS") or 20)
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE") or 30)
+OUTBOUND_GROUP_RATE_PER_MINUTE = float(
+    os.getenv("OUTBOUND_GROUP_RATE_PER_MINUTE") or 20
+)
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE") or 100000)
+CACHE_TTL_IN_SECONDS = int(os.getenv("CACHE_TTL_IN_SECONDS") or 3600)
+ADMINS_CACHE_TTL_IN_SECONDS = int(os.getenv("ADMINS_CACHE_TTL_IN_SECONDS") or 600)
+SWEEPER_RATE = float(os.getenv("SWEEPER_RATE") or 1)
+SWEEPER_BATCH_SIZE = int(os.getenv("SWEEPER_BATCH_SIZE") or 100)
+SWEEPER_INTERVAL_IN_SECONDS = int(os.getenv("SWEEPER_INTERVAL_IN_SECONDS") or 86400)
+# Streak lengths in days that are congratulated, comma-separated.
+MILESTONES = tuple(
+    int(days) for days in (os.getenv("MILESTONES") or "7,30,90,365").split(",")
+)
+MILESTONE_RATE = float(os.getenv("MILESTONE_RATE") or 1)
+MILESTONE_BATCH_SIZE = int(os.getenv("MILESTONE_BATCH_SIZE") or 100)
+MILESTONE_INTERVAL_IN_SECONDS = int(os.getenv("MILESTONE_INTERVAL_IN_SECONDS") or 300)
 TOKEN = os.getenv("TOKEN")
+# A local Bot API server, e.g. http://localhost:8081. Defaults to Telegram.
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
 BASE_REPO = os.getenv("BASE_REPO") or "https://github.com/Aqendo/streak-bot"
 SHOW_BASE_REPO_IN_HELP = (
     True if os.getenv("SHOW_BASE_REPO_IN_HELP") == "true" else False
 )
+# "polling", "webhook" or "worker" (background work only, no updates)
+RUN_MODE = os.getenv("RUN_MODE") or "polling"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH") or "/webhook"
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST") or "0.0.0.0"
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT") or 8080)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS") or 10)
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES") or 1000)
+# Background work is split into this many shards shared by all processes
+# through lease rows, 0 runs everything in this process.
+CLUSTER_SHARDS = int(os.getenv("CLUSTER_SHARDS") or 0)
+CLUSTER_LEASE_TTL_IN_SECONDS = float(os.getenv("CLUSTER_LEASE_TTL_IN_SECONDS") or 30)
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# Prometheus metrics, 0 disables the endpoint.
+METRICS_HOST = os.getenv("METRICS_HOST") or "127.0.0.1"
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)
 
 
 class Emoji:
@@ -26,3 +87,4 @@ class Emoji:
     TROPHY = "🏆"
     OK = "🆗"
     ARROW_RIGHT = "↪️"
+    GLOBE = "🌍"
@@ -1,30 +1,52 @@
-from aiogram.types import Message
+from typing import Dict
+
 from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import ChatMember, Message
+from kink import di
+
+from services.cache import MISSING, LRUCache
+
+
+async def get_chat_admins(bot: Bot, chat_id: int) -> Dict[int, ChatMember]:
+    """Administrators of `chat_id` by user id, cached in `di["admins_cache"]`."""
+    admins_cache: LRUCache = di["admins_cache"]
+    admins = admins_cache.get(chat_id)
+    if admins is MISSING:
+        members = await bot.get_chat_administrators(chat_id)
+        admins = {member.user.id: member for member in members}
+        admins_cache.set(chat_id, admins)
+    return admins
 
 
 # Is delete_chat is really a `function` type? IDK.
 async def check_admins(
-    message: Message, bot: Bot, delete_if_chat, matter_if_admin_can_delete_user=True
+    message: Message,
+    bot: Bot,
+    delete_if_chat,
+    autodelete: bool,
+    matter_if_admin_can_delete_user=True,
 ) -> bool:
+    # Anonymous admins write on behalf of the group itself.
+    if message.sender_chat and message.sender_chat.id == message.chat.id:
+        return True
     try:
-        user_who_deletes = await bot.get_chat_member(
-            message.chat.id, message.from_user.id
-        )
-    except:
+        admins = await get_chat_admins(bot, message.chat.id)
+    except TelegramAPIError:
         msg = await message.reply(
             "I can't get chat admins! Please report this error to the support group."
         )
-        await delete_if_chat(message, msg)
+        await delete_if_chat(autodelete, message, msg)
         return False
-    if (
-        matter_if_admin_can_delete_user and not user_who_deletes.can_restrict_members
-    ) and not (
-        user_who_deletes.status != "administrator"
-        or user_who_deletes.status != "creator"
+    user_who_deletes = admins.get(message.from_user.id)
+    if user_who_deletes is None or (
+        matter_if_admin_can_delete_user
+        and user_who_deletes.status != "creator"
+        and not user_who_deletes.can_restrict_members
     ):
         msg = await message.reply(
             "This command is admin-only (with ability to restrict members)!"
         )
-        await delete_if_chat(message, msg)
+        await delete_if_chat(autodelete, message, msg)
         return False
     return True
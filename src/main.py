@@ -1,78 +1,195 @@
+import time
+
+# Taken before anything else is imported, to time the imports.
+STARTED = time.perf_counter()
+
+# isort: split
 import asyncio
 import datetime
+import functools
 import logging
+import signal
+from typing import Optional, Union
 
 import aiogram
 from aiogram import Bot, Dispatcher, F, Router
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command
 from aiogram.filters.command import CommandObject
 from aiogram.types import (
     CallbackQuery,
+    ChatMemberUpdated,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     Message,
 )
 from dotenv import find_dotenv, load_dotenv
 from kink import di
-from sqlalchemy import asc, delete, select
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import (
-    AsyncConnection,
     AsyncSession,
     async_sessionmaker,
-    create_async_engine,
 )
 
 from consts import (
+    ADMINS_CACHE_TTL_IN_SECONDS,
+    AUTODELETE_DELAY_IN_SECONDS,
     BASE_REPO,
-    POSTGRES_DB,
-    POSTGRES_HOST,
-    POSTGRES_LOGIN,
-    POSTGRES_PASSWORD,
+    CACHE_MAX_SIZE,
+    CACHE_TTL_IN_SECONDS,
+    CLUSTER_LEASE_TTL_IN_SECONDS,
+    CLUSTER_SHARDS,
+    DATABASE_MAX_OVERFLOW,
+    DATABASE_POOL,
+    DATABASE_POOL_PRE_PING,
+    DATABASE_POOL_RECYCLE_IN_SECONDS,
+    DATABASE_POOL_SIZE,
+    DATABASE_POOL_TIMEOUT_IN_SECONDS,
+    DATABASE_URL,
+    GLOBAL_TOP_SIZE,
+    HISTORY_SIZE,
+    INSTANCE_ID,
+    MAX_PENDING_UPDATES,
+    METRICS_HOST,
+    METRICS_PORT,
+    MILESTONE_BATCH_SIZE,
+    MILESTONE_INTERVAL_IN_SECONDS,
+    MILESTONE_RATE,
+    MILESTONES,
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_GROUP_RATE_PER_MINUTE,
+    RUN_MODE,
+    SCOREBOARD_PAGE_SIZE,
+    SCOREBOARD_WORKERS,
     SHOW_BASE_REPO_IN_HELP,
     SQLALCHEMY_ECHO,
+    SWEEPER_BATCH_SIZE,
+    SWEEPER_INTERVAL_IN_SECONDS,
+    SWEEPER_RATE,
+    TELEGRAM_API_URL,
     TIMEOUT_SCOREBOARD_IN_SECONDS,
     TOKEN,
+    UPDATE_WORKERS,
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
     Emoji,
 )
 from helpers import check_admins
-from messages import get_help_message, get_relapse_message, get_stats_text
+from messages import (
+    get_help_message,
+    get_history_stats_text,
+    get_history_text,
+    get_relapse_message,
+    get_stats_text,
+)
+from middlewares.database import database_session
+from middlewares.metrics import measure_handler
 from middlewares.update_usernames import update_users_info
-from models.database import GroupUser, Group, Users
+from models.database import Users, UserStats
+from models.engine import PoolProfile, create_engine
+from models.repository import (
+    create_user,
+    delete_live_scoreboard,
+    delete_users,
+    join_scoreboard,
+    register_relapse,
+    save_live_scoreboard,
+    set_autodelete,
+    set_banned,
+    set_group_milestones,
+    set_streak_start,
+    set_user_milestones,
+    update_live_scoreboard,
+)
+from models.schema import prepare_schema
+from models.session import commit
+from services.autodelete import DeletionQueue
+from services.cache import LRUCache
+from services.cluster import ShardLeases, Shards
+from services.history import (
+    fetch_recent_relapses,
+    record_relapse,
+    summarize,
+)
+from services.leaderboard import (
+    DatabaseRanking,
+    GlobalRanking,
+    fetch_global_top,
+    sync_global_leaderboard,
+)
+from services.metrics import (
+    BotAPIMetrics,
+    CacheLookups,
+    Gauge,
+    instrument_engine,
+    registry,
+    run_metrics_server,
+)
+from services.milestones import MilestoneNotifier
+from services.outbound import OutboundLimiter
+from services.rendering import ScoreboardRenderer
+from services.resolver import remember_username, resolve_user_id
+from services.scoreboards import (
+    PAGE_NEXT,
+    PAGE_PREVIOUS,
+    Cursor,
+    Rendered,
+    ScoreboardScheduler,
+    content_hash,
+    decode_cursor,
+    encode_cursor,
+    fetch_scoreboard_page,
+    mark_scoreboards_dirty,
+)
+from services.startup import StartupTimer
+from services.sweeper import AccountSweeper, is_deleted_account
+from services.updates import UpdateScheduler, poll_updates
 
 load_dotenv(find_dotenv())
 
-di["engine"] = create_async_engine(
-    f"postgresql+asyncpg://{POSTGRES_LOGIN}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}/{POSTGRES_DB}",
+di["engine"] = create_engine(
+    DATABASE_URL,
     echo=SQLALCHEMY_ECHO,
+    profile=PoolProfile(DATABASE_POOL),
+    pool_size=DATABASE_POOL_SIZE,
+    max_overflow=DATABASE_MAX_OVERFLOW,
+    pool_timeout=DATABASE_POOL_TIMEOUT_IN_SECONDS,
+    pool_recycle=DATABASE_POOL_RECYCLE_IN_SECONDS,
+    pool_pre_ping=DATABASE_POOL_PRE_PING,
 )
+instrument_engine(di["engine"].sync_engine)
 
 di["async_session"] = async_sessionmaker(di["engine"], expire_on_commit=False)
+di["users_cache"] = LRUCache(maxsize=CACHE_MAX_SIZE, ttl=CACHE_TTL_IN_SECONDS)
+di["groups_cache"] = LRUCache(maxsize=CACHE_MAX_SIZE, ttl=CACHE_TTL_IN_SECONDS)
+di["admins_cache"] = LRUCache(maxsize=CACHE_MAX_SIZE, ttl=ADMINS_CACHE_TTL_IN_SECONDS)
+di["usernames_cache"] = LRUCache(maxsize=CACHE_MAX_SIZE, ttl=CACHE_TTL_IN_SECONDS)
+di["scoreboard_renderer"] = ScoreboardRenderer(maxsize=CACHE_MAX_SIZE)
 
 router = Router()
 pool = None
-scoreboards = {}
 dp = Dispatcher()
 dp.include_router(router)
 
 
-async def create_all() -> None:
-    conn: AsyncConnection
-    async with di["engine"].begin() as conn:
-        await conn.run_sync(Users.metadata.create_all)
-        await conn.run_sync(Group.metadata.create_all)
-        await conn.run_sync(GroupUser.metadata.create_all)
-
-
+dp.update.outer_middleware.register(database_session)
 dp.update.outer_middleware.register(update_users_info)
+for observer in (
+    router.message,
+    router.callback_query,
+    router.chat_member,
+    router.my_chat_member,
+):
+    observer.middleware(measure_handler)
 
 
 async def delete_if_chat(autodelete, message, msg_sent):
     if message.chat.id != message.from_user.id and autodelete:
-        await asyncio.sleep(20)
-        try:
-            await msg_sent.delete()
-        except:
-            pass
+        await di["deletion_queue"].enqueue(msg_sent.chat.id, msg_sent.message_id)
 
 
 @router.message(Command(commands=["start"]))
@@ -84,189 +201,224 @@ async def command_start_handler(message: Message, autodelete: bool) -> None:
 
 
 @router.message(Command(commands=["enablescoreboard", "enableScoreboard"]))
-async def enablescoreboard_handler(message: Message, autodelete: bool) -> None:
+async def enablescoreboard_handler(
+    message: Message, autodelete: bool, session: AsyncSession, user: Optional[Users]
+) -> None:
     if message.chat.id == message.from_user.id:
         msg = await message.reply(
             f"{Emoji.FORBIDDEN} You can't enable scoreboards in private chat."
         )
         await delete_if_chat(autodelete, message, msg)
         return
-    session: AsyncSession
-    async with di["async_session"]() as session:
-        session_result = await session.scalar(
-            select(Users).where(Users.user_id == message.from_user.id)
-        )
-        if session_result is None:
-            msg = await message.reply(
-                f"{Emoji.ARROW_RIGHT} Use /streak to start a new streak."
-            )
-            await delete_if_chat(autodelete, message, msg)
-            return
-        session_result = await session.scalar(
-            select(GroupUser).where(
-                GroupUser.user_id == message.from_user.id,
-                GroupUser.group_id == message.chat.id,
-            )
+    if user is None:
+        msg = await message.reply(
+            f"{Emoji.ARROW_RIGHT} Use /streak to start a new streak."
         )
-        if session_result is None:
-            session.add(
-                GroupUser(user_id=message.from_user.id, group_id=message.chat.id)
-            )
-            await session.commit()
-            msg = await message.reply(
-                f"{Emoji.TICK} You are now appearing on the scoreboard.",
-                reply_markup=InlineKeyboardMarkup(
-                    inline_keyboard=[
-                        [
-                            InlineKeyboardButton(
-                                text="Turn this message into a scoreboard",
-                                callback_data=f"turn_{message.from_user.id}",
-                            )
-                        ]
+        await delete_if_chat(autodelete, message, msg)
+        return
+    joined = await join_scoreboard(session, message.chat.id, message.from_user.id)
+    if joined:
+        await sync_global_leaderboard(session, message.from_user.id)
+    await commit(session)
+    if joined:
+        di["scoreboard_scheduler"].mark_dirty(message.chat.id)
+        msg = await message.reply(
+            f"{Emoji.TICK} You are now appearing on the scoreboard.",
+            reply_markup=InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [
+                        InlineKeyboardButton(
+                            text="Turn this message into a scoreboard",
+                            callback_data=f"turn_{message.from_user.id}",
+                        )
                     ]
-                ),
-            )
-        else:
-            msg = await message.reply(
-                f"{Emoji.FORBIDDEN} You already enabled scoreboards.",
-                reply_markup=InlineKeyboardMarkup(
-                    inline_keyboard=[
-                        [
-                            InlineKeyboardButton(
-                                text="Turn this message into a scoreboard",
-                                callback_data=f"turn_{message.from_user.id}",
-                            )
-                        ]
+                ]
+            ),
+        )
+    else:
+        msg = await message.reply(
+            f"{Emoji.FORBIDDEN} You already enabled scoreboards.",
+            reply_markup=InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [
+                        InlineKeyboardButton(
+                            text="Turn this message into a scoreboard",
+                            callback_data=f"turn_{message.from_user.id}",
+                        )
                     ]
-                ),
-            )
+                ]
+            ),
+        )
 
 
 @router.message(Command(commands=["streak"]))
-async def register_handler(message: Message, autodelete: bool) -> None:
-    session: AsyncSession
-    async with di["async_session"]() as session:
-        session_result = await session.scalar(
-            select(Users).where(Users.user_id == message.from_user.id)
+async def register_handler(
+    message: Message, autodelete: bool, session: AsyncSession, user: Optional[Users]
+) -> None:
+    if user is None:
+        created = await create_user(
+            session,
+            message.from_user.id,
+            message.from_user.full_name,
+            message.from_user.username,
+            datetime.datetime.now(),
         )
-        if session_result is None:
-            session.add(
-                Users(
-                    user_id=message.from_user.id,
-                    name=message.from_user.full_name,
-                    username=message.from_user.username,
-                    streak=datetime.datetime.now(),
-                    attempts=1,
-                    maximum_days=0,
-                    all_days=0,
-                )
-            )
-            await session.commit()
+        await commit(session)
+        di["users_cache"].invalidate(message.from_user.id)
+        if created:
+            remember_username(message.from_user.id, None, message.from_user.username)
             msg = await message.reply("Streak has been started! You have 0 days!")
-        else:
-            days = (datetime.datetime.now() - session_result.streak).days
-            days_str = "days" if days != 1 else "day"
-            msg = await message.answer(
-                f"Hey {message.from_user.full_name}.\n{Emoji.FIRE} Your streak is {days} {days_str} long.\n\n{Emoji.CROSS} Use /relapse if you have relapsed.",
-                parse_mode=None,
-            )
+            await delete_if_chat(autodelete, message, msg)
+            return
+        # Another /streak of the same user got there first.
+        user = await session.scalar(
+            select(Users).where(Users.user_id == message.from_user.id)
+        )
+        await commit(session)
+    days = (datetime.datetime.now() - user.streak).days
+    days_str = "days" if days != 1 else "day"
+    msg = await message.answer(
+        f"Hey {message.from_user.full_name}.\n{Emoji.FIRE} Your streak is {days} {days_str} long.\n\n{Emoji.CROSS} Use /relapse if you have relapsed.",
+        parse_mode=None,
+    )
     await delete_if_chat(autodelete, message, msg)
 
 
 @router.message(Command(commands=["stats"]))
-async def stats_handler(message: Message, autodelete: bool) -> None:
-    session: AsyncSession
-    async with di["async_session"]() as session:
-        session_result = await session.scalar(
-            select(Users).where(Users.user_id == message.from_user.id)
-        )
-        if session_result is None:
-            msg = await message.reply("↪️ Use /streak to start a new streak.")
-            await delete_if_chat(autodelete, message, msg)
-            return
-        attempts = session_result.attempts
-        days = (datetime.datetime.now() - session_result.streak).days
+async def stats_handler(
+    message: Message, autodelete: bool, session: AsyncSession, user: Optional[Users]
+) -> None:
+    ranking: Union[GlobalRanking, DatabaseRanking] = di["global_ranking"]
+    if user is None:
+        msg = await message.reply("↪️ Use /streak to start a new streak.")
+        await delete_if_chat(autodelete, message, msg)
+        return
+    attempts = user.attempts
+    now = datetime.datetime.now()
+    days = (now - user.streak).days
 
-        # I believe this was taken from here: https://stackoverflow.com/questions/3644417/python-format-datetime-with-st-nd-rd-th-english-ordinal-suffix-likes
-        days_text = str(attempts) + (
-            "th"
-            if 4 <= attempts % 100 <= 20
-            else {1: "st", 2: "nd", 3: "rd"}.get(attempts % 10, "th")
-        )
+    # I believe this was taken from here: https://stackoverflow.com/questions/3644417/python-format-datetime-with-st-nd-rd-th-english-ordinal-suffix-likes
+    days_text = str(attempts) + (
+        "th"
+        if 4 <= attempts % 100 <= 20
+        else {1: "st", 2: "nd", 3: "rd"}.get(attempts % 10, "th")
+    )
+    global_rank, global_total = await ranking.lookup(session, user.user_id)
+    stats_text = get_stats_text(
+        name=message.from_user.full_name,
+        all_days=user.all_days + days,
+        highest=user.maximum_days,
+        attempt=days_text,
+        current=days,
+        global_rank=global_rank,
+        global_total=global_total,
+    )
+    history_stats = await session.get(UserStats, user.user_id)
+    await commit(session)
+    if history_stats is not None:
+        stats_text += get_history_stats_text(**summarize(history_stats, now)._asdict())
+    msg = await message.reply(stats_text)
+    await delete_if_chat(autodelete, message, msg)
+
+
+@router.message(Command(commands=["history"]))
+async def history_handler(
+    message: Message, autodelete: bool, session: AsyncSession, user: Optional[Users]
+) -> None:
+    if user is None:
+        msg = await message.reply("↪️ Use /streak to start a new streak.")
+        await delete_if_chat(autodelete, message, msg)
+        return
+    relapses = await fetch_recent_relapses(session, user.user_id, HISTORY_SIZE)
+    await commit(session)
+    msg = await message.reply(
+        get_history_text(
+            name=message.from_user.full_name,
+            relapses=[(relapse.relapsed_at, relapse.days) for relapse in relapses],
+        ),
+        parse_mode=None,
+    )
+    await delete_if_chat(autodelete, message, msg)
+
+
+@router.message(Command(commands=["top"]))
+async def top_handler(
+    message: Message, autodelete: bool, session: AsyncSession
+) -> None:
+    rows = await fetch_global_top(session, GLOBAL_TOP_SIZE, datetime.datetime.now())
+    await commit(session)
+    if not rows:
         msg = await message.reply(
-            get_stats_text(
-                name=message.from_user.full_name,
-                all_days=session_result.all_days + days,
-                highest=session_result.maximum_days,
-                attempt=days_text,
-                current=days,
-            )
+            f"{Emoji.GLOBE} Nobody is on the global leaderboard yet. Use /enableScoreboard in a group to show up here."
         )
         await delete_if_chat(autodelete, message, msg)
+        return
+    texts = di["scoreboard_renderer"].split(
+        f"{Emoji.GLOBE} Global leaderboard\n\n", list(enumerate(rows, 1))
+    )
+    msg = await message.reply(texts[0])
+    await delete_if_chat(autodelete, message, msg)
+    for text in texts[1:]:
+        msg = await message.answer(text)
+        await delete_if_chat(autodelete, message, msg)
 
 
 @router.message(Command(commands=["deleteAllDataAboutMe", "deletealldataaboutme"]))
-async def deleteAllDataAboutMe_handler(message: Message, autodelete: bool) -> None:
-    session: AsyncSession
-    async with di["async_session"]() as session:
-        session_result = await session.scalar(
-            select(Users).where(Users.user_id == message.from_user.id)
-        )
-        if session_result is None:
-            msg = await message.reply(
-                "I don't have any info about you at the moment. You can register a streak with /streak command."
-            )
-            await delete_if_chat(autodelete, message, msg)
-            return
+async def deleteAllDataAboutMe_handler(
+    message: Message, autodelete: bool, user: Optional[Users]
+) -> None:
+    if user is None:
         msg = await message.reply(
-            "Are you sure you want to delete <b>ALL</b> data about yourself? This is <b>IRREVERSIBLE</b> and no one on the entire planet Earth will be able to restore your streaks!",
-            reply_markup=InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [
-                        InlineKeyboardButton(
-                            text="Yes",
-                            callback_data=f"remove_{message.from_user.id}",
-                        ),
-                        InlineKeyboardButton(
-                            text="No",
-                            callback_data=f"cancel_{message.from_user.id}",
-                        ),
-                    ]
-                ]
-            ),
+            "I don't have any info about you at the moment. You can register a streak with /streak command."
         )
         await delete_if_chat(autodelete, message, msg)
+        return
+    msg = await message.reply(
+        "Are you sure you want to delete <b>ALL</b> data about yourself? This is <b>IRREVERSIBLE</b> and no one on the entire planet Earth will be able to restore your streaks!",
+        reply_markup=InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(
+                        text="Yes",
+                        callback_data=f"remove_{message.from_user.id}",
+                    ),
+                    InlineKeyboardButton(
+                        text="No",
+                        callback_data=f"cancel_{message.from_user.id}",
+                    ),
+                ]
+            ]
+        ),
+    )
+    await delete_if_chat(autodelete, message, msg)
 
 
 @router.message(Command(commands=["relapse"]))
-async def relapse_handler(message: Message, autodelete: bool) -> None:
-    session: AsyncSession
-    async with di["async_session"]() as session:
-        session_result = await session.scalar(
-            select(Users).where(Users.user_id == message.from_user.id)
-        )
-        if session_result is None:
-            msg = await message.reply("To start a streak, write /streak")
-            await delete_if_chat(autodelete, message, msg)
-            return
-        msg = await message.reply(
-            "Are you sure you want to register a <b>relapse</b>?",
-            reply_markup=InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [
-                        InlineKeyboardButton(
-                            text="Yes",
-                            callback_data=f"relapse_{message.from_user.id}",
-                        ),
-                        InlineKeyboardButton(
-                            text="No",
-                            callback_data=f"cancel_{message.from_user.id}",
-                        ),
-                    ]
-                ]
-            ),
-        )
+async def relapse_handler(
+    message: Message, autodelete: bool, user: Optional[Users]
+) -> None:
+    if user is None:
+        msg = await message.reply("To start a streak, write /streak")
         await delete_if_chat(autodelete, message, msg)
+        return
+    msg = await message.reply(
+        "Are you sure you want to register a <b>relapse</b>?",
+        reply_markup=InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(
+                        text="Yes",
+                        callback_data=f"relapse_{message.from_user.id}_{user.attempts}",
+                    ),
+                    InlineKeyboardButton(
+                        text="No",
+                        callback_data=f"cancel_{message.from_user.id}",
+                    ),
+                ]
+            ]
+        ),
+    )
+    await delete_if_chat(autodelete, message, msg)
 
 
 @router.callback_query(F.data.startswith("cancel_"))
@@ -294,54 +446,56 @@ async def help(message: Message, autodelete: bool) -> None:
 
 
 @router.message(Command(commands=["removeFromLeaderboard", "removefromleaderboard"]))
-async def check(
-    message: Message, bot: Bot, command: CommandObject, autodelete: bool
+async def remove_from_leaderboard(
+    message: Message,
+    bot: Bot,
+    command: CommandObject,
+    autodelete: bool,
+    session: AsyncSession,
 ) -> None:
     if message.chat.id == message.from_user.id:
         msg = await message.reply(f"{Emoji.CROSS} This command works only in groups.")
         await delete_if_chat(autodelete, message, msg)
         return
-    if not command.args:
+    if not command.args and message.reply_to_message is None:
         msg = await message.reply(
-            f"{Emoji.CROSS} Not enough arguments\.\n**USAGE**:\n`/removeFromLeaderboard \<\+id/\+username\>`\n\n_Deletes an account from scoreboard \(admins only\)_",
+            f"{Emoji.CROSS} Not enough arguments\.\n**USAGE**:\n`/removeFromLeaderboard \<\+id/\+username\>` or as a reply to their message\n\n_Deletes an account from scoreboard \(admins only\)_",
             parse_mode="MarkdownV2",
         )
         await delete_if_chat(autodelete, message, msg)
         return
-    user_to_delete = command.args
-    session: AsyncSession
-    async with di["async_session"]() as session:
-        if not user_to_delete.isnumeric():
-            user_result = await session.scalar(
-                select(Users).where(Users.username == user_to_delete.strip("@"))
-            )
-            if not user_result:
-                msg = await message.reply("This user never used me")
-                await delete_if_chat(autodelete, message, msg)
-                return
-            user_to_delete = user_result.user_id
-        user_to_delete = int(user_to_delete)
-        user = await session.scalar(
-            select(GroupUser).where(
-                GroupUser.group_id == message.chat.id,
-                GroupUser.user_id == user_to_delete,
-            )
-        )
-        user.is_banned = True
-        is_admin = await check_admins(message, bot, delete_if_chat)
-        if not is_admin:
-            return
-        session.add(user)
-        await session.commit()
-        msg = await message.answer(
-            f"Succesfully removed account with id {user_to_delete} from scoreboard of this group."
+    user_to_delete = await resolve_user_id(session, message, command.args)
+    await commit(session)
+    if user_to_delete is None:
+        msg = await message.reply("This user never used me")
+        await delete_if_chat(autodelete, message, msg)
+        return
+    is_admin = await check_admins(message, bot, delete_if_chat, autodelete)
+    if not is_admin:
+        return
+    if not await set_banned(session, message.chat.id, user_to_delete, True):
+        await commit(session)
+        msg = await message.reply(
+            "This account never enabled the scoreboard of this group."
         )
         await delete_if_chat(autodelete, message, msg)
+        return
+    await sync_global_leaderboard(session, user_to_delete)
+    await commit(session)
+    di["scoreboard_scheduler"].mark_dirty(message.chat.id)
+    msg = await message.answer(
+        f"Succesfully removed account with id {user_to_delete} from scoreboard of this group."
+    )
+    await delete_if_chat(autodelete, message, msg)
 
 
 @router.message(Command(commands=["autodelete"]))
 async def autodelete_handler(
-    message: Message, bot: Bot, command: Command, autodelete: bool
+    message: Message,
+    bot: Bot,
+    command: Command,
+    autodelete: bool,
+    session: AsyncSession,
 ):
     if message.chat.id == message.from_user.id:
         await message.reply(f"{Emoji.CROSS} This command works only in groups.")
@@ -358,264 +512,551 @@ async def autodelete_handler(
         await delete_if_chat(autodelete, message, msg)
         return
     is_admin = await check_admins(
-        message, bot, delete_if_chat, matter_if_admin_can_delete_user=False
+        message,
+        bot,
+        delete_if_chat,
+        autodelete,
+        matter_if_admin_can_delete_user=False,
     )
     if not is_admin:
         return
-    session: AsyncSession
-    async with di["async_session"]() as session:
-        group = await session.scalar(
-            select(Group).where(Group.group_id == message.chat.id)
-        )
-        if command.args.lower() == "on":
-            group.autodelete = True
-        elif command.args.lower() == "off":
-            group.autodelete = False
-        else:
-            await message.reply(
-                "For some reason bot handled /autodelete with wrong parameter. Report this."
-            )
-            return
-        session.add(group)
-        await session.commit()
+    await set_autodelete(session, message.chat.id, command.args.lower() == "on")
+    await commit(session)
+    di["groups_cache"].invalidate(message.chat.id)
     await message.answer(
         "Successfully turned autodeleting messages " + command.args.lower()
     )
 
 
+@router.message(Command(commands=["milestones"]))
+async def milestones_handler(
+    message: Message,
+    bot: Bot,
+    command: Command,
+    autodelete: bool,
+    session: AsyncSession,
+    user: Optional[Users],
+):
+    if (
+        not isinstance(command.args, str)
+        or not command.args
+        or command.args.lower() not in ["on", "off"]
+    ):
+        msg = await message.reply(
+            f"{Emoji.CROSS} Not enough arguments\.\n**USAGE**:\n`/milestones \<on\/off\>`\n_Enables or disables congratulations when a streak reaches a milestone, for you in private or for all members in groups \(admins only\)_",
+            parse_mode="MarkdownV2",
+        )
+        await delete_if_chat(autodelete, message, msg)
+        return
+    enabled = command.args.lower() == "on"
+    if message.chat.id == message.from_user.id:
+        if user is None:
+            await message.reply("↪️ Use /streak to start a new streak.")
+            return
+        await set_user_milestones(session, user.user_id, enabled)
+        await commit(session)
+        di["users_cache"].invalidate(user.user_id)
+        await message.reply(
+            "Successfully turned milestone messages " + command.args.lower()
+        )
+        return
+    is_admin = await check_admins(
+        message,
+        bot,
+        delete_if_chat,
+        autodelete,
+        matter_if_admin_can_delete_user=False,
+    )
+    if not is_admin:
+        return
+    await set_group_milestones(session, message.chat.id, enabled)
+    await commit(session)
+    msg = await message.answer(
+        "Successfully turned milestone messages " + command.args.lower()
+    )
+    await delete_if_chat(autodelete, message, msg)
+
+
+@router.chat_member()
+@router.my_chat_member()
+async def chat_member_handler(event: ChatMemberUpdated) -> None:
+    for member in (event.old_chat_member, event.new_chat_member):
+        if member.status in ("administrator", "creator"):
+            di["admins_cache"].invalidate(event.chat.id)
+            return
+
+
 @router.message(Command(commands=["returnToLeaderboard", "returntoleaderboard"]))
 async def returntoleaderboard(
-    message: Message, bot: Bot, command: CommandObject, autodelete: bool
+    message: Message,
+    bot: Bot,
+    command: CommandObject,
+    autodelete: bool,
+    session: AsyncSession,
 ) -> None:
     if message.chat.id == message.from_user.id:
         await message.reply(f"{Emoji.CROSS} This command works only in groups.")
         return
-    if not command.args:
+    if not command.args and message.reply_to_message is None:
         msg = await message.reply(
-            f"{Emoji.CROSS} Not enough arguments\.\n**USAGE**:\n`/returnToLeaderboard \<\+id/\+username\>`\n_Returns an account to scoreboard if it's banned \(admins only\)_",
+            f"{Emoji.CROSS} Not enough arguments\.\n**USAGE**:\n`/returnToLeaderboard \<\+id/\+username\>` or as a reply to their message\n_Returns an account to scoreboard if it's banned \(admins only\)_",
             parse_mode="MarkdownV2",
         )
         await delete_if_chat(autodelete, message, msg)
         return
-    user_to_delete = command.args
-    session: AsyncSession
-    async with di["async_session"]() as session:
-        if not user_to_delete.isnumeric():
-            user_result = await session.scalar(
-                select(Users).where(Users.username == user_to_delete.strip("@"))
-            )
-            if not user_result:
-                msg = await message.reply("This user never used me")
-                await delete_if_chat(autodelete, message, msg)
-                return
-            user_to_delete = user_result.user_id
-        user_to_delete = int(user_to_delete)
-        user = await session.scalar(
-            select(GroupUser).where(
-                GroupUser.group_id == message.chat.id,
-                GroupUser.user_id == user_to_delete,
-            )
-        )
-        user.is_banned = False
-        is_admin = await check_admins(message, bot, delete_if_chat)
-        if not is_admin:
-            return
-        session.add(user)
-        await session.commit()
-        msg = await message.answer(
-            f"Succesfully returned an account with id {user_to_delete} to scoreboard of this group."
+    user_to_delete = await resolve_user_id(session, message, command.args)
+    await commit(session)
+    if user_to_delete is None:
+        msg = await message.reply("This user never used me")
+        await delete_if_chat(autodelete, message, msg)
+        return
+    is_admin = await check_admins(message, bot, delete_if_chat, autodelete)
+    if not is_admin:
+        return
+    if not await set_banned(session, message.chat.id, user_to_delete, False):
+        await commit(session)
+        msg = await message.reply(
+            "This account never enabled the scoreboard of this group."
         )
         await delete_if_chat(autodelete, message, msg)
+        return
+    await sync_global_leaderboard(session, user_to_delete)
+    await commit(session)
+    di["scoreboard_scheduler"].mark_dirty(message.chat.id)
+    msg = await message.answer(
+        f"Succesfully returned an account with id {user_to_delete} to scoreboard of this group."
+    )
+    await delete_if_chat(autodelete, message, msg)
 
 
 @router.message(Command(commands=["check"]))
 async def check(
-    message: Message, bot: Bot, command: CommandObject, autodelete: bool
+    message: Message,
+    bot: Bot,
+    command: CommandObject,
+    autodelete: bool,
+    session: AsyncSession,
 ) -> None:
-    if not command.args:
+    if not command.args and message.reply_to_message is None:
         msg = await message.reply(
-            f"{Emoji.CROSS} Not enough arguments\.\n**USAGE**:\n`/check \<\+id/\+username\>`\n\n_Deletes an account from scoreboard if it's been deleted_",
+            f"{Emoji.CROSS} Not enough arguments\.\n**USAGE**:\n`/check \<\+id/\+username\>` or as a reply to their message\n\n_Deletes an account from scoreboard if it's been deleted_",
             parse_mode="MarkdownV2",
         )
         await delete_if_chat(autodelete, message, msg)
         return
-    user_to_delete = command.args
-    session: AsyncSession
-    async with di["async_session"]() as session:
-        if not user_to_delete.isnumeric():
-            user_result = await session.scalar(
-                select(Users).where(Users.username == user_to_delete.strip("@"))
-            )
-            if not user_result:
-                msg = await message.reply("This user never used me")
-                await delete_if_chat(autodelete, message, msg)
-                return
-            user_to_delete = user_result.user_id
-        else:
-            user_result = await session.scalar(
-                select(Users).where(Users.user_id == int(user_to_delete))
-            )
-            if not user_result:
-                msg = await message.reply("This user never used me")
-                await delete_if_chat(autodelete, message, msg)
-                return
-            user_to_delete = int(user_to_delete)
-        member = None
-        try:
-            member = await bot.get_chat_member(message.chat.id, user_to_delete)
-        except:
-            msg = await message.reply(
-                "Query failed. If you sure you entered right ID, then wait some time to Telegram to wake up from maintenance or something."
-            )
-            await delete_if_chat(autodelete, message, msg)
-            return
-        if not member:
-            return
-        if member.user.first_name != "" and member.user.first_name != "Deleted Account":
-            msg = await message.reply(
-                "This user is alive and hasn't deleted his account yet."
-            )
-            await delete_if_chat(autodelete, message, msg)
-            return
-        await session.delete(user_result)
-        await session.execute(
-            delete(GroupUser).where(GroupUser.user_id == user_to_delete)
+    user_to_delete = await resolve_user_id(session, message, command.args)
+    user_result = None
+    if user_to_delete is not None:
+        user_result = await session.scalar(
+            select(Users).where(Users.user_id == user_to_delete)
         )
-        await session.commit()
-        msg = await message.answer(
-            f"Succesfully removed account with id {user_to_delete} from my database."
+    await commit(session)
+    if not user_result:
+        msg = await message.reply("This user never used me")
+        await delete_if_chat(autodelete, message, msg)
+        return
+    member = None
+    try:
+        member = await bot.get_chat_member(message.chat.id, user_to_delete)
+    except:
+        msg = await message.reply(
+            "Query failed. If you sure you entered right ID, then wait some time to Telegram to wake up from maintenance or something."
+        )
+        await delete_if_chat(autodelete, message, msg)
+        return
+    if not member:
+        return
+    if not is_deleted_account(member.user):
+        msg = await message.reply(
+            "This user is alive and hasn't deleted his account yet."
         )
         await delete_if_chat(autodelete, message, msg)
+        return
+    await mark_scoreboards_dirty(session, user_to_delete)
+    await delete_users(session, [user_to_delete])
+    await commit(session)
+    di["global_ranking"].discard(user_to_delete)
+    di["users_cache"].invalidate(user_to_delete)
+    remember_username(user_to_delete, user_result.username, None)
+    msg = await message.answer(
+        f"Succesfully removed account with id {user_to_delete} from my database."
+    )
+    await delete_if_chat(autodelete, message, msg)
 
 
 @router.callback_query(F.data.startswith("relapse_"))
-async def register_a_relapse(callback_query: CallbackQuery) -> None:
-    if callback_query.from_user.id != int(callback_query.data.split("_", 1)[1]):
+async def register_a_relapse(
+    callback_query: CallbackQuery, session: AsyncSession, user: Optional[Users]
+) -> None:
+    # Buttons sent before relapses were tied to an attempt lack its number.
+    _, owner, *attempts = callback_query.data.split("_")
+    if callback_query.from_user.id != int(owner):
         await callback_query.answer(
             f"{Emoji.FORBIDDEN} This button was not meant for you"
         )
         return
-    session: AsyncSession
-    async with di["async_session"]() as session:
-        session_result = await session.scalar(
-            select(Users).where(Users.user_id == callback_query.from_user.id)
-        )
-        days = (datetime.datetime.now() - session_result.streak).days
-        if days > session_result.maximum_days:
-            session_result.maximum_days = days
-        session_result.all_days += days
-        session_result.streak = datetime.datetime.now()
-        session_result.attempts += 1
-        session.add(session_result)
-        await session.commit()
-        await callback_query.message.edit_text(
-            get_relapse_message(days=days, name=callback_query.from_user.full_name),
-            disable_web_page_preview=True,
-        )
+    if user is None:
+        await callback_query.answer("↪️ Use /streak to start a new streak.")
+        return
+    now = datetime.datetime.now()
+    relapse = await register_relapse(
+        session, user.user_id, now, int(attempts[0]) if attempts else None
+    )
+    if relapse is None:
+        await commit(session)
+        await callback_query.answer("This relapse has already been registered.")
+        return
+    await record_relapse(
+        session, user.user_id, relapse.streak_started, now, relapse.days
+    )
+    await sync_global_leaderboard(session, user.user_id)
+    await mark_scoreboards_dirty(session, callback_query.from_user.id)
+    await commit(session)
+    await callback_query.message.edit_text(
+        get_relapse_message(days=relapse.days, name=callback_query.from_user.full_name),
+        disable_web_page_preview=True,
+    )
 
 
 @router.callback_query(F.data.startswith("remove_"))
-async def remove_all_data_logic(callback_query: CallbackQuery) -> None:
+async def remove_all_data_logic(
+    callback_query: CallbackQuery, session: AsyncSession
+) -> None:
     if callback_query.from_user.id != int(callback_query.data.split("_", 1)[1]):
         await callback_query.answer(
             f"{Emoji.FORBIDDEN} This button was not meant for you"
         )
         return
+    await mark_scoreboards_dirty(session, callback_query.from_user.id)
+    await delete_users(session, [callback_query.from_user.id])
+    await commit(session)
+    di["global_ranking"].discard(callback_query.from_user.id)
+    di["users_cache"].invalidate(callback_query.from_user.id)
+    remember_username(
+        callback_query.from_user.id, callback_query.from_user.username, None
+    )
+    await callback_query.message.edit_text(
+        f"""{Emoji.BIN} From now I know nothing about you! All your data was erased forever. If you want to start again, just use /streak command.""",
+    )
+
+
+async def scoreboard(
+    bot: Bot,
+    chat_id: int,
+    message_id: int,
+    cursor: Optional[Cursor] = None,
+    rendered_hash: Optional[str] = None,
+) -> Rendered:
+    rollover_at = None
+    now = datetime.datetime.now()
     session: AsyncSession
     async with di["async_session"]() as session:
-        await session.execute(
-            delete(Users).where(Users.user_id == callback_query.from_user.id)
+        page = await fetch_scoreboard_page(
+            session, chat_id, cursor, SCOREBOARD_PAGE_SIZE, now
         )
-        await session.execute(
-            delete(GroupUser).where(GroupUser.user_id == callback_query.from_user.id)
+    message_result, shown = di["scoreboard_renderer"].render(
+        f"{Emoji.TROPHY} Scoreboard\n\n", [(row.rank, row) for row in page.rows]
+    )
+    # Rows that don't fit into a message move to the next page.
+    rows = page.rows[:shown]
+    has_next = page.has_next or shown < len(page.rows)
+    for row in rows:
+        user_rollover_at = row.streak + datetime.timedelta(days=row.days + 1)
+        if rollover_at is None or user_rollover_at < rollover_at:
+            rollover_at = user_rollover_at
+    buttons = []
+    if page.has_previous and rows:
+        first = rows[0]
+        buttons.append(
+            InlineKeyboardButton(
+                text="⬅️ Previous",
+                callback_data=encode_cursor(PAGE_PREVIOUS, first.streak, first.user_id),
+            )
         )
-        await session.commit()
-        await callback_query.message.edit_text(
-            f"""{Emoji.BIN} From now I know nothing about you! All your data was erased forever. If you want to start again, just use /streak command.""",
+    if has_next and rows:
+        last = rows[-1]
+        buttons.append(
+            InlineKeyboardButton(
+                text="Next ➡️",
+                callback_data=encode_cursor(PAGE_NEXT, last.streak, last.user_id),
+            )
+        )
+    reply_markup = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    rendered = Rendered(rollover_at, content_hash(message_result, reply_markup))
+    if rendered.content_hash == rendered_hash:
+        return rendered
+    try:
+        await bot.edit_message_text(
+            message_result,
+            chat_id=chat_id,
+            message_id=message_id,
+            reply_markup=reply_markup,
         )
+    except aiogram.exceptions.TelegramForbiddenError:
+        # The bot was kicked from the group.
+        await forget_scoreboard(chat_id, message_id)
+    except aiogram.exceptions.TelegramBadRequest as e:
+        if "message to edit not found" in e.message or "chat not found" in e.message:
+            await forget_scoreboard(chat_id, message_id)
+        elif "message is not modified" not in e.message:
+            logging.warning("Failed to edit scoreboard in %d: %s", chat_id, e.message)
+    return rendered
 
 
-async def scoreboard(callback_query: CallbackQuery) -> None:
+async def forget_scoreboard(chat_id: int, message_id: int) -> None:
+    """Stops refreshing a scoreboard that can't be edited anymore, here and
+    after restarts. Another process may own the chat, so the row is deleted
+    right away rather than by the scheduler."""
+    di["scoreboard_scheduler"].unregister(chat_id, message_id)
     session: AsyncSession
     async with di["async_session"]() as session:
-        session_result = await session.execute(
-            select(Users)
-            .join(GroupUser, Users.user_id == GroupUser.user_id)
-            .filter(
-                GroupUser.group_id == callback_query.message.chat.id,
-                GroupUser.is_banned == False,
-            )
-            .order_by(asc(Users.streak))
-            .limit(50)
-        )
-        message_result = f"{Emoji.TROPHY} Scoreboard\n\n"
-        for id, users_tuple in enumerate(session_result.all()):
-            username = users_tuple[0].username
-            name_text = users_tuple[0].name
-            username_text = ""
-            days = (datetime.datetime.now() - users_tuple[0].streak).days
-            if username is not None:
-                username_text = " (@" + username + ")"
-            else:
-                name_text = (
-                    f"<a href='tg://user?id={users_tuple[0].user_id}'>{name_text}</a>"
-                )
-
-            message_result += "%d. %s %s — <b>%d %s</b>\n" % (
-                id + 1,
-                name_text,
-                username_text,
-                days,
-                "days" if days != 1 else "day",
-            )
-        try:
-            await callback_query.message.edit_text(message_result)
-        except aiogram.exceptions.TelegramBadRequest:
-            return
+        await delete_live_scoreboard(session, chat_id, message_id)
+        await session.commit()
 
 
 @router.callback_query(F.data.startswith("turn_"))
-async def turn_scoreboard(callback_query: CallbackQuery) -> None:
+async def turn_scoreboard(callback_query: CallbackQuery, bot: Bot) -> None:
     if callback_query.from_user.id != int(callback_query.data.split("_", 1)[1]):
         await callback_query.answer(
             f"{Emoji.FORBIDDEN} This button was not meant for you"
         )
         return
-    scoreboards[callback_query.chat_instance] = callback_query.message
-    while scoreboards[callback_query.chat_instance] == callback_query.message:
-        await scoreboard(callback_query)
-        await asyncio.sleep(TIMEOUT_SCOREBOARD_IN_SECONDS)
+    chat_id = callback_query.message.chat.id
+    message_id = callback_query.message.message_id
+    # Committed in a session of its own before the scheduler knows about it:
+    # the refresh that register() starts right away updates this row.
+    session: AsyncSession
+    async with di["async_session"]() as session:
+        await save_live_scoreboard(
+            session, chat_id, message_id, callback_query.from_user.id
+        )
+        await session.commit()
+    if not di["scoreboard_scheduler"].register(chat_id, message_id):
+        # Another process refreshes this chat and picks the scoreboard up
+        # within a lease round; show it right away meanwhile.
+        rendered = await scoreboard(bot, chat_id, message_id)
+        async with di["async_session"]() as session:
+            await update_live_scoreboard(
+                session,
+                chat_id,
+                message_id,
+                rendered.content_hash,
+                rendered.rollover_at,
+            )
+            await session.commit()
+    await callback_query.answer()
+
+
+@router.callback_query(F.data.startswith("sb_"))
+async def scoreboard_page(callback_query: CallbackQuery, bot: Bot) -> None:
+    cursor = decode_cursor(callback_query.data)
+    chat_id = callback_query.message.chat.id
+    message_id = callback_query.message.message_id
+    rendered = await scoreboard(bot, chat_id, message_id, cursor)
+    di["scoreboard_scheduler"].set_cursor(
+        chat_id, message_id, cursor, rendered.content_hash
+    )
+    await callback_query.answer()
 
 
 @router.message(Command(commands=["setstreak", "setStreak"]))
-async def set_streak(message: Message, autodelete: bool) -> None:
+async def set_streak(
+    message: Message, autodelete: bool, session: AsyncSession, user: Optional[Users]
+) -> None:
     days = message.text.split(" ", 1)[-1]
     if not days.isnumeric() or int(days) > 100000:
         return
     days = int(days)
-    session: AsyncSession
-    async with di["async_session"]() as session:
-        session_result = await session.scalar(
-            select(Users).where(Users.user_id == message.from_user.id)
-        )
-    if session_result is None:
+    if user is None:
         msg = await message.answer("↪️ Use /streak to start a new streak.")
         await delete_if_chat(autodelete, message, msg)
         return
-    session_result.streak = datetime.datetime.now() - datetime.timedelta(days=days)
-    session.add(session_result)
-    await session.commit()
+    await set_streak_start(
+        session, user.user_id, datetime.datetime.now() - datetime.timedelta(days=days)
+    )
+    await sync_global_leaderboard(session, user.user_id)
+    await mark_scoreboards_dirty(session, message.from_user.id)
+    await commit(session)
     days_str = "days" if days != 1 else "day"
     msg = await message.answer(f"{Emoji.TICK} Now your streak is {days} " + days_str)
     await delete_if_chat(autodelete, message, msg)
 
 
+def register_service_metrics() -> None:
+    for metric in (
+        Gauge(
+            "streakbot_scoreboards_active",
+            "Live scoreboards being refreshed.",
+            lambda: len(di["scoreboard_scheduler"]),
+        ),
+        Gauge(
+            "streakbot_autodelete_backlog",
+            "Messages waiting to be deleted.",
+            di["deletion_queue"].backlog,
+        ),
+        Gauge(
+            "streakbot_updates_pending",
+            "Updates waiting for a worker.",
+            lambda: di["update_scheduler"].pending,
+        ),
+        Gauge(
+            "streakbot_updates_in_flight",
+            "Updates being processed.",
+            lambda: di["update_scheduler"].in_flight,
+        ),
+        CacheLookups(
+            "streakbot_cache_lookups_total",
+            "Cache lookups, by cache and result.",
+            {
+                "users": di["users_cache"],
+                "groups": di["groups_cache"],
+                "admins": di["admins_cache"],
+                "usernames": di["usernames_cache"],
+                "scoreboard_lines": di["scoreboard_renderer"].cache,
+            },
+        ),
+    ):
+        registry.register(metric)
+
+
 async def main() -> None:
-    await create_all()
-    logging.info("created")
-    bot = Bot(TOKEN, parse_mode="HTML")
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    timer = StartupTimer(STARTED)
+    timer.mark("imports")
+    await prepare_schema(di["engine"])
+    timer.mark("schema")
+    # In a cluster other processes change streaks too, so ranks are counted
+    # in the database instead of kept in memory.
+    di["global_ranking"] = DatabaseRanking() if CLUSTER_SHARDS else GlobalRanking()
+    session: AsyncSession
+    async with di["async_session"]() as session:
+        await di["global_ranking"].load(session)
+    timer.mark("ranking")
+    bot_session = None
+    if TELEGRAM_API_URL:
+        bot_session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+    bot = Bot(TOKEN, parse_mode="HTML", session=bot_session)
+    bot.session.middleware(
+        OutboundLimiter(
+            global_rate=OUTBOUND_GLOBAL_RATE,
+            group_rate=OUTBOUND_GROUP_RATE_PER_MINUTE / 60,
+        )
+    )
+    bot.session.middleware(BotAPIMetrics())
+    task = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, task.cancel)
+    try:
+        await serve(bot, timer)
+    except asyncio.CancelledError:
+        logging.info("Shutting down")
+    finally:
+        await shutdown(bot)
+
+
+async def shutdown(bot: Bot) -> None:
+    """Stops the services that were started, newest first, so that what
+    they hold in memory is stored and their shards go to the other
+    processes right away."""
+    for name in (
+        "update_scheduler",
+        "milestone_notifier",
+        "account_sweeper",
+        "deletion_queue",
+        "scoreboard_scheduler",
+        "shards",
+    ):
+        if name not in di:
+            continue
+        try:
+            await di[name].stop()
+        except Exception:
+            logging.exception("Failed to stop %s", name)
+    await bot.session.close()
+
+
+async def serve(bot: Bot, timer: StartupTimer) -> None:
+    if RUN_MODE == "webhook" and not WEBHOOK_SECRET:
+        raise RuntimeError(
+            "WEBHOOK_SECRET is required in webhook mode, otherwise anyone who "
+            "finds the URL can post updates."
+        )
+    if CLUSTER_SHARDS:
+        di["shards"] = ShardLeases(
+            INSTANCE_ID, CLUSTER_SHARDS, ttl=CLUSTER_LEASE_TTL_IN_SECONDS
+        )
+    else:
+        di["shards"] = Shards()
+    await di["shards"].start()
+    timer.mark("shards")
+    di["scoreboard_scheduler"] = ScoreboardScheduler(
+        refresh=functools.partial(scoreboard, bot),
+        interval=TIMEOUT_SCOREBOARD_IN_SECONDS,
+        workers=SCOREBOARD_WORKERS,
+        shards=di["shards"],
+    )
+    async with di["async_session"]() as session:
+        await di["scoreboard_scheduler"].resume(session)
+    di["shards"].subscribe(di["scoreboard_scheduler"].sync)
+    await di["scoreboard_scheduler"].start()
+    timer.mark("scoreboards")
+    di["deletion_queue"] = DeletionQueue(
+        bot, delay=AUTODELETE_DELAY_IN_SECONDS, shards=di["shards"]
+    )
+    await di["deletion_queue"].start()
+    di["account_sweeper"] = AccountSweeper(
+        bot,
+        rate=SWEEPER_RATE,
+        batch_size=SWEEPER_BATCH_SIZE,
+        interval=SWEEPER_INTERVAL_IN_SECONDS,
+        shards=di["shards"],
+    )
+    await di["account_sweeper"].start()
+    di["milestone_notifier"] = MilestoneNotifier(
+        bot,
+        milestones=MILESTONES,
+        rate=MILESTONE_RATE,
+        batch_size=MILESTONE_BATCH_SIZE,
+        interval=MILESTONE_INTERVAL_IN_SECONDS,
+        shards=di["shards"],
+    )
+    await di["milestone_notifier"].start()
+    di["update_scheduler"] = UpdateScheduler(
+        process=functools.partial(dp.feed_update, bot),
+        workers=UPDATE_WORKERS,
+        max_pending=MAX_PENDING_UPDATES,
+    )
+    await di["update_scheduler"].start()
+    if METRICS_PORT:
+        register_service_metrics()
+        try:
+            await run_metrics_server(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            # Metrics are not worth refusing to serve users.
+            logging.warning(
+                "Can't serve metrics on %s:%d: %s", METRICS_HOST, METRICS_PORT, e
+            )
+    timer.mark("services")
+    logging.info(timer.report())
+    if RUN_MODE == "webhook":
+        from services.webhook import run_webhook
+
+        await run_webhook(
+            dp,
+            bot,
+            url=WEBHOOK_URL,
+            path=WEBHOOK_PATH,
+            host=WEBHOOK_HOST,
+            port=WEBHOOK_PORT,
+            secret_token=WEBHOOK_SECRET,
+            scheduler=di["update_scheduler"],
+        )
+    elif RUN_MODE == "worker":
+        # Updates are received by another process.
+        await asyncio.Event().wait()
+    else:
+        await bot.delete_webhook(drop_pending_updates=True)
+        await poll_updates(dp, bot, di["update_scheduler"])
 
 
 if __name__ == "__main__":
@@ -1,13 +1,94 @@
+import datetime
+import html
+from typing import List, Optional, Tuple
+
+
 def get_stats_text(
-    name: str, all_days: int, highest: int, attempt: int, current: int
+    name: str,
+    all_days: int,
+    highest: int,
+    attempt: int,
+    current: int,
+    global_rank: Optional[int] = None,
+    global_total: int = 0,
 ) -> str:
-    return f"""Hey {name}, these are your stats.
+    text = f"""Hey {name}, these are your stats.
 
 📅 You went {all_days} days without relapsing
 ⚡️ Your highest streak is {highest} days
 💂 This is your {attempt} attempt
 🔥 Your current streak is {current} days long
 """
+    if global_rank is not None:
+        text += (
+            f"🌍 You are #{global_rank} of {global_total} on the global leaderboard\n"
+        )
+    return text
+
+
+def get_history_stats_text(
+    average_streak: float,
+    longest_streak: int,
+    relapses_per_month: float,
+    window_relapses: int,
+    previous_window_relapses: int,
+) -> str:
+    if window_relapses < previous_window_relapses:
+        trend = "📉"
+    elif window_relapses > previous_window_relapses:
+        trend = "📈"
+    else:
+        trend = "➡️"
+    return f"""
+📏 Your average streak is {average_streak:.1f} days
+🏅 Your longest recorded streak is {longest_streak} days
+🔁 You relapse {relapses_per_month:.1f} times a month
+{trend} {window_relapses} relapses in the last 30 days, {previous_window_relapses} in the 30 days before
+"""
+
+
+def get_history_text(name: str, relapses: List[Tuple[datetime.datetime, int]]) -> str:
+    if not relapses:
+        return f"Hey {name}, you haven't relapsed since I started keeping history. 🍀"
+    text = f"Hey {name}, these are your latest relapses.\n\n"
+    for relapsed_at, days in relapses:
+        text += f"🗓 {relapsed_at:%Y-%m-%d} — after {days} {'days' if days != 1 else 'day'}\n"
+    return text
+
+
+def get_scoreboard_line(
+    user_id: int, name: str, username: Optional[str], days: int
+) -> str:
+    """A scoreboard line without its rank, which goes in front of it."""
+    name = html.escape(name, quote=False)
+    username_text = ""
+    if username is not None:
+        username_text = " (@" + html.escape(username, quote=False) + ")"
+    else:
+        name = f"<a href='tg://user?id={user_id}'>{name}</a>"
+    return "%s %s — <b>%d %s</b>\n" % (
+        name,
+        username_text,
+        days,
+        "days" if days != 1 else "day",
+    )
+
+
+def get_milestone_text(days: int) -> str:
+    return f"""🎉 {days} days! Your streak just reached {days} days.
+
+Keep going, every day counts. Use /milestones off to stop these messages."""
+
+
+def get_group_milestone_text(
+    user_id: int, name: str, username: Optional[str], days: int
+) -> str:
+    name = html.escape(name, quote=False)
+    if username is not None:
+        mention = f"{name} (@{html.escape(username, quote=False)})"
+    else:
+        mention = f"<a href='tg://user?id={user_id}'>{name}</a>"
+    return f"🎉 {mention} has reached a streak of <b>{days} days</b>!"
 
 
 def get_help_message() -> str:
@@ -16,11 +97,14 @@ def get_help_message() -> str:
 /enableScoreboard - ✅  make your account show up on the scoreboard
 /setStreak <daysCount> - ⚙️ set a custom streak
 /stats - 📊 display some statistics 
+/top - 🌍 display the global leaderboard
+/history - 🗓 display your latest relapses
 /check <id/username> - 🔧  deletes account from scoreboard if it's been deleted
 /deleteAllDataAboutMe - 🗑 delete all data about yourself
 /removeFromLeaderboard <id/username> - 🗑 remove user from leaderboard of this group (admin-only!)
 /returnToLeaderboard <id/username> - 🗑 return user to leaderboard of this group, if it's banned (admin-only!)
 /autodelete <on/off> - 🔧 enables or disabled autodeleting messages in groups (admin-only!)
+/milestones <on/off> - 🎉 congratulations when your streak reaches a milestone, in groups for all members (admin-only in groups!)
 """
 
 
@@ -0,0 +1,24 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram.types import Update
+from kink import di
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.session import commit
+
+
+async def database_session(
+    handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+    event: Update,
+    data: Dict[str, Any],
+) -> Any:
+    # A session only checks out a connection on its first query, so updates
+    # that never touch the database don't cost a connection. Handlers end
+    # their transaction before their first Bot API call; this commits the
+    # rest.
+    session: AsyncSession
+    async with di["async_session"]() as session:
+        data["session"] = session
+        result = await handler(event, data)
+        await commit(session)
+    return result
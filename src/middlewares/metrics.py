@@ -0,0 +1,23 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram.types import TelegramObject
+
+from services.metrics import HANDLER_DURATION, HANDLER_ERRORS
+
+
+async def measure_handler(
+    handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+    event: TelegramObject,
+    data: Dict[str, Any],
+) -> Any:
+    # Inner middlewares run after the filters, so the handler is known.
+    name = data["handler"].callback.__name__
+    started = time.perf_counter()
+    try:
+        return await handler(event, data)
+    except Exception:
+        HANDLER_ERRORS.inc(name)
+        raise
+    finally:
+        HANDLER_DURATION.observe(time.perf_counter() - started, name)
@@ -2,10 +2,15 @@ from typing import Any, Awaitable, Callable, Dict
 
 from aiogram.types import Update
 from kink import di
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models.database import Users, Group
+from models.database import Users
+from models.repository import ensure_group
+from models.session import after_commit, commit
+from services.cache import MISSING, LRUCache
+from services.resolver import remember_username
+from services.scoreboards import mark_scoreboards_dirty
 
 
 async def update_users_info(
@@ -13,33 +18,69 @@ async def update_users_info(
     event: Update,
     data: Dict[str, Any],
 ) -> Any:
-    event_old = event
-    if not event.message:
-        return await handler(event_old, data)
-    event = event.message
-    session: AsyncSession
-    async with di["async_session"]() as session:
-        user = await session.scalar(
-            select(Users).where(Users.user_id == event.from_user.id)
+    if event.message:
+        message = event.message
+        from_user = message.from_user
+        # Only commands reach a handler that needs the Users row, plain chat
+        # messages are served from the cache.
+        needs_user = (message.text or message.caption or "").startswith("/")
+    elif event.callback_query:
+        message = None
+        from_user = event.callback_query.from_user
+        needs_user = True
+    else:
+        return await handler(event, data)
+    users_cache: LRUCache = di["users_cache"]
+    groups_cache: LRUCache = di["groups_cache"]
+    session: AsyncSession = data["session"]
+
+    user = None
+    # (name, username) of a registered user, None for unknown users.
+    user_info = MISSING if needs_user else users_cache.get(from_user.id)
+    if user_info is MISSING:
+        user = await session.scalar(select(Users).where(Users.user_id == from_user.id))
+        user_info = None if user is None else (user.name, user.username)
+        users_cache.set(from_user.id, user_info)
+    if needs_user:
+        data["user"] = user
+    if user_info is not None and user_info != (from_user.full_name, from_user.username):
+        if user is not None:
+            user.name = from_user.full_name
+            user.username = from_user.username
+        else:
+            await session.execute(
+                update(Users)
+                .where(Users.user_id == from_user.id)
+                .values(name=from_user.full_name, username=from_user.username)
+            )
+        await mark_scoreboards_dirty(session, from_user.id)
+        after_commit(
+            session,
+            lambda: users_cache.set(
+                from_user.id, (from_user.full_name, from_user.username)
+            ),
         )
-        if user is not None and (
-            user.name != event.from_user.full_name
-            or user.username != event.from_user.username
-        ):
-            user.name = event.from_user.full_name
-            user.username = event.from_user.username
-            session.add(user)
-            await session.commit()
-        if event.chat.id != event.from_user.id:
-            group = await session.scalar(
-                select(Group).where(Group.group_id == event.chat.id)
+        if user_info[1] != from_user.username:
+            old_username = user_info[1]
+            after_commit(
+                session,
+                lambda: remember_username(
+                    from_user.id, old_username, from_user.username
+                ),
             )
-            if not group:
-                session.add(Group(group_id=event.chat.id))
-                await session.commit()
-                data["autodelete"] = False
-            else:
-                data["autodelete"] = group.autodelete
-        else:
-            data["autodelete"] = False
-    return await handler(event_old, data)
+    # Also ends a read-only transaction, so no connection idles in it while
+    # the handler waits for the Bot API.
+    await commit(session)
+
+    if message is None:
+        return await handler(event, data)
+    if message.chat.id != from_user.id:
+        autodelete = groups_cache.get(message.chat.id)
+        if autodelete is MISSING:
+            autodelete = await ensure_group(session, message.chat.id)
+            await commit(session)
+            groups_cache.set(message.chat.id, autodelete)
+        data["autodelete"] = autodelete
+    else:
+        data["autodelete"] = False
+    return await handler(event, data)
@@ -1,6 +1,7 @@
 import datetime
+from typing import Optional
 
-from sqlalchemy import BigInteger, Boolean, String, func
+from sqlalchemy import BigInteger, Boolean, Index, String, and_, false, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -10,21 +11,38 @@ class Base(DeclarativeBase):
 
 class Group(Base):
     __tablename__ = "group"
+    __table_args__ = (Index("ux_group_group_id", "group_id", unique=True),)
     id: Mapped[int] = mapped_column(primary_key=True)
     group_id: Mapped[int] = mapped_column(BigInteger(), nullable=False)
     autodelete: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    # Congratulate scoreboard members on their milestones in the group.
+    milestones: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default=false(), nullable=False
+    )
 
 
 class GroupUser(Base):
     __tablename__ = "group_user"
+    __table_args__ = (
+        Index("ux_group_user_group_id_user_id", "group_id", "user_id", unique=True),
+        Index("ix_group_user_user_id", "user_id"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(BigInteger())
     group_id: Mapped[int] = mapped_column(BigInteger())
     is_banned: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Set by the account sweeper for members that left the group.
+    has_left: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default=false()
+    )
 
 
 class Users(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ux_users_user_id", "user_id", unique=True),
+        Index("ix_users_streak", "streak", "user_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(BigInteger())
@@ -34,3 +52,123 @@ class Users(Base):
     attempts: Mapped[int]
     maximum_days: Mapped[int] = mapped_column(BigInteger())
     all_days: Mapped[int] = mapped_column(BigInteger())
+    # Congratulate the user on their milestones in the private chat.
+    milestones: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default=false(), nullable=False
+    )
+
+
+Index("ix_users_username_lower", func.lower(Users.username))
+Index(
+    "ix_group_user_scoreboard",
+    GroupUser.group_id,
+    GroupUser.user_id,
+    postgresql_where=and_(
+        GroupUser.is_banned == false(), GroupUser.has_left == false()
+    ),
+    sqlite_where=and_(GroupUser.is_banned == false(), GroupUser.has_left == false()),
+)
+
+
+class PendingDeletion(Base):
+    __tablename__ = "pending_deletion"
+    __table_args__ = (Index("ix_pending_deletion_due_at", "due_at"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger())
+    message_id: Mapped[int] = mapped_column(BigInteger())
+    due_at: Mapped[datetime.datetime]
+
+
+# Users that show up on at least one group scoreboard, kept in sync by the
+# handlers that change streaks or scoreboard membership.
+class GlobalLeaderboard(Base):
+    __tablename__ = "global_leaderboard"
+    __table_args__ = (Index("ix_global_leaderboard_streak", "streak", "user_id"),)
+
+    user_id: Mapped[int] = mapped_column(BigInteger(), primary_key=True)
+    streak: Mapped[datetime.datetime]
+
+
+class RelapseEvent(Base):
+    __tablename__ = "relapse_event"
+    __table_args__ = (
+        Index("ix_relapse_event_user_id_relapsed_at", "user_id", "relapsed_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger())
+    streak_started: Mapped[datetime.datetime]
+    relapsed_at: Mapped[datetime.datetime]
+    days: Mapped[int]
+
+
+# Aggregates over relapse_event, updated together with every new event.
+class UserStats(Base):
+    __tablename__ = "user_stats"
+
+    user_id: Mapped[int] = mapped_column(BigInteger(), primary_key=True)
+    tracking_since: Mapped[datetime.datetime]
+    relapses: Mapped[int] = mapped_column(default=0)
+    total_days: Mapped[int] = mapped_column(BigInteger(), default=0)
+    longest_streak: Mapped[int] = mapped_column(default=0)
+    last_relapse_at: Mapped[datetime.datetime]
+    # Relapses in the current and the previous 30-day window.
+    window_start: Mapped[datetime.datetime]
+    window_relapses: Mapped[int] = mapped_column(default=0)
+    previous_window_relapses: Mapped[int] = mapped_column(default=0)
+
+
+# Where a background job stopped, so it resumes there after a restart.
+class JobCheckpoint(Base):
+    __tablename__ = "job_checkpoint"
+
+    name: Mapped[str] = mapped_column(String(), primary_key=True)
+    group_id: Mapped[Optional[int]] = mapped_column(BigInteger())
+    user_id: Mapped[Optional[int]] = mapped_column(BigInteger())
+    # End of the last complete pass.
+    finished_at: Mapped[Optional[datetime.datetime]]
+
+
+# The message every group turned into a live scoreboard, so refreshing
+# resumes after a restart.
+class LiveScoreboard(Base):
+    __tablename__ = "live_scoreboard"
+
+    chat_id: Mapped[int] = mapped_column(BigInteger(), primary_key=True)
+    message_id: Mapped[int] = mapped_column(BigInteger())
+    # Who pressed the button.
+    owner: Mapped[int] = mapped_column(BigInteger())
+    # Of the text and the buttons last sent, to skip edits that change nothing.
+    last_rendered_hash: Mapped[Optional[str]] = mapped_column(String())
+    # When the content goes stale on its own, i.e. a day count rolls over.
+    next_due: Mapped[Optional[datetime.datetime]]
+
+
+# Processes of a clustered deployment, see services.cluster.
+class ClusterMember(Base):
+    __tablename__ = "cluster_member"
+
+    instance_id: Mapped[str] = mapped_column(String(), primary_key=True)
+    expires_at: Mapped[datetime.datetime]
+
+
+# Which process runs the background work of a shard, until `expires_at`.
+class ShardLease(Base):
+    __tablename__ = "shard_lease"
+
+    shard: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    owner: Mapped[str] = mapped_column(String())
+    expires_at: Mapped[datetime.datetime]
+
+
+# Milestone congratulations that were sent, or are being sent, so none is
+# sent twice. A new streak can reach the same milestones again.
+class MilestoneNotification(Base):
+    __tablename__ = "milestone_notification"
+
+    chat_id: Mapped[int] = mapped_column(BigInteger(), primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger(), primary_key=True)
+    streak: Mapped[datetime.datetime] = mapped_column(primary_key=True)
+    milestone: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    sent_at: Mapped[datetime.datetime]
@@ -0,0 +1,89 @@
+import enum
+from typing import Any, Dict
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from services.metrics import TimedQueuePool
+
+# Applied to every new SQLite connection. WAL lets readers run next to the
+# writer, and waiting on a lock beats failing with "database is locked".
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=30000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+)
+
+
+class PoolProfile(enum.Enum):
+    # The bot talks to PostgreSQL itself and keeps its connections.
+    DIRECT = "direct"
+    # Behind PgBouncer with pool_mode=transaction.
+    PGBOUNCER = "pgbouncer"
+    # A new connection for every session, for an external pooler that
+    # should own all idle connections.
+    NULL = "null"
+
+
+def create_engine(
+    url: str,
+    echo: bool = False,
+    profile: PoolProfile = PoolProfile.DIRECT,
+    pool_size: int = 10,
+    max_overflow: int = 10,
+    pool_timeout: float = 30,
+    pool_recycle: int = -1,
+    pool_pre_ping: bool = False,
+) -> AsyncEngine:
+    """Creates the engine for a postgresql+asyncpg or sqlite+aiosqlite URL."""
+    parsed = make_url(url)
+    options: Dict[str, Any] = {"echo": echo}
+    if profile is PoolProfile.NULL:
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=pool_pre_ping,
+        )
+
+    if parsed.get_backend_name() != "sqlite":
+        if profile is PoolProfile.PGBOUNCER:
+            # Imports asyncpg, which SQLite deployments don't need.
+            from models.pgbouncer import PgBouncerConnection
+
+            # Prepared statements don't outlive a transaction, so caching
+            # them on either side only produces "does not exist" errors.
+            options["connect_args"] = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "connection_class": PgBouncerConnection,
+            }
+        elif profile is PoolProfile.NULL:
+            # Connections live for one session, a cache would never be hit.
+            options["connect_args"] = {"prepared_statement_cache_size": 0}
+        return create_async_engine(url, **options)
+
+    if parsed.database in (None, "", ":memory:"):
+        # Every connection to :memory: is a database of its own, so the
+        # default pool of a single shared connection stays.
+        engine = create_async_engine(url, echo=echo)
+    else:
+        engine = create_async_engine(url, **options)
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
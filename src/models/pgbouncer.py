@@ -0,0 +1,16 @@
+import uuid
+
+import asyncpg
+
+
+class PgBouncerConnection(asyncpg.Connection):
+    """Names prepared statements uniquely.
+
+    In transaction mode server connections are shared between clients, and
+    asyncpg numbers statements with a counter that starts at 1 in every
+    process, so names collide with statements another client (or a previous
+    run) left on the same server connection.
+    """
+
+    def _get_unique_id(self, prefix: str) -> str:
+        return f"__asyncpg_{prefix}_{uuid.uuid4().hex}__"
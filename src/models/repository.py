@@ -0,0 +1,424 @@
+import datetime
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, select, true, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.database import (
+    ClusterMember,
+    GlobalLeaderboard,
+    Group,
+    GroupUser,
+    JobCheckpoint,
+    LiveScoreboard,
+    MilestoneNotification,
+    RelapseEvent,
+    ShardLease,
+    UserStats,
+    Users,
+)
+from models.sql import days_since, greatest, insert
+
+# Every write below is a single statement, so two clicks on the same button
+# can't interleave between a read and a write of the same row.
+
+
+class Relapse(NamedTuple):
+    streak_started: datetime.datetime
+    days: int
+
+
+async def create_user(
+    session: AsyncSession,
+    user_id: int,
+    name: str,
+    username: Optional[str],
+    now: datetime.datetime,
+) -> bool:
+    """Starts a streak for a new user. Returns False if they already exist."""
+    created = await session.scalar(
+        insert(session, Users)
+        .values(
+            user_id=user_id,
+            name=name,
+            username=username,
+            streak=now,
+            attempts=1,
+            maximum_days=0,
+            all_days=0,
+        )
+        .on_conflict_do_nothing(index_elements=[Users.user_id])
+        .returning(Users.id)
+    )
+    return created is not None
+
+
+async def register_relapse(
+    session: AsyncSession,
+    user_id: int,
+    now: datetime.datetime,
+    attempts: Optional[int] = None,
+) -> Optional[Relapse]:
+    """Ends the current streak of `user_id` and starts a new one at `now`.
+
+    With `attempts` the relapse is only registered if it is still the
+    attempt the button was created for, so a double click counts once.
+    Returns None if nothing was registered.
+    """
+    if session.bind.dialect.name == "sqlite":
+        return await _register_relapse_sqlite(session, user_id, now, attempts)
+    users = Users.__table__
+    previous = select(users.c.user_id, users.c.streak).where(users.c.user_id == user_id)
+    if attempts is not None:
+        previous = previous.where(users.c.attempts == attempts)
+    # Locking the row makes a concurrent relapse wait and then see the
+    # streak this one started.
+    previous = previous.with_for_update().subquery("previous")
+    days = days_since(previous.c.streak, now)
+    # A Core statement: the ORM can't return columns of the subquery.
+    row = (
+        await session.execute(
+            update(users)
+            .where(users.c.user_id == previous.c.user_id)
+            .values(
+                streak=now,
+                attempts=users.c.attempts + 1,
+                all_days=users.c.all_days + days,
+                maximum_days=greatest(users.c.maximum_days, days),
+            )
+            .returning(previous.c.streak, days.label("days"))
+        )
+    ).first()
+    if row is None:
+        return None
+    return Relapse(streak_started=row.streak, days=row.days)
+
+
+async def _register_relapse_sqlite(
+    session: AsyncSession,
+    user_id: int,
+    now: datetime.datetime,
+    attempts: Optional[int],
+) -> Optional[Relapse]:
+    # SQLite can't return columns of the FROM clause of an UPDATE, so the
+    # streak is read first and the write only lands if no relapse happened
+    # in between.
+    while True:
+        row = (
+            await session.execute(
+                select(Users.streak, Users.attempts).where(Users.user_id == user_id)
+            )
+        ).first()
+        if row is None or attempts is not None and row.attempts != attempts:
+            return None
+        days = (now - row.streak).days
+        updated = await session.scalar(
+            update(Users)
+            .where(Users.user_id == user_id, Users.attempts == row.attempts)
+            .values(
+                streak=now,
+                attempts=Users.attempts + 1,
+                all_days=Users.all_days + days,
+                maximum_days=greatest(Users.maximum_days, days),
+            )
+            .returning(Users.id)
+            .execution_options(synchronize_session=False)
+        )
+        if updated is not None:
+            return Relapse(streak_started=row.streak, days=days)
+
+
+async def set_streak_start(
+    session: AsyncSession, user_id: int, streak: datetime.datetime
+) -> bool:
+    updated = await session.scalar(
+        update(Users)
+        .where(Users.user_id == user_id)
+        .values(streak=streak)
+        .returning(Users.id)
+        .execution_options(synchronize_session=False)
+    )
+    return updated is not None
+
+
+async def join_scoreboard(session: AsyncSession, group_id: int, user_id: int) -> bool:
+    """Adds `user_id` to the scoreboard of `group_id`. Returns False if they
+    were already on it (or banned from it).
+
+    Sending the command proves they are in the group, so a membership the
+    account sweeper marked as left is restored right away.
+    """
+    statement = insert(session, GroupUser).values(
+        group_id=group_id, user_id=user_id, is_banned=False, has_left=False
+    )
+    row = (
+        await session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[GroupUser.group_id, GroupUser.user_id],
+                set_={"has_left": False},
+                where=GroupUser.has_left == true(),
+            ).returning(GroupUser.is_banned)
+        )
+    ).first()
+    return row is not None and not row.is_banned
+
+
+async def set_banned(
+    session: AsyncSession, group_id: int, user_id: int, is_banned: bool
+) -> bool:
+    """Returns False if `user_id` never enabled the scoreboard of `group_id`."""
+    updated = await session.scalar(
+        update(GroupUser)
+        .where(GroupUser.group_id == group_id, GroupUser.user_id == user_id)
+        .values(is_banned=is_banned)
+        .returning(GroupUser.id)
+        .execution_options(synchronize_session=False)
+    )
+    return updated is not None
+
+
+async def ensure_group(session: AsyncSession, group_id: int) -> bool:
+    """Creates the row of `group_id` if needed and returns its autodelete."""
+    statement = insert(session, Group).values(group_id=group_id, autodelete=False)
+    # A no-op update instead of DO NOTHING, so RETURNING also yields the
+    # existing row.
+    return await session.scalar(
+        statement.on_conflict_do_update(
+            index_elements=[Group.group_id],
+            set_={"autodelete": Group.autodelete},
+        ).returning(Group.autodelete)
+    )
+
+
+async def set_autodelete(
+    session: AsyncSession, group_id: int, autodelete: bool
+) -> None:
+    statement = insert(session, Group).values(group_id=group_id, autodelete=autodelete)
+    await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[Group.group_id],
+            set_={"autodelete": statement.excluded.autodelete},
+        )
+    )
+
+
+async def set_group_milestones(
+    session: AsyncSession, group_id: int, milestones: bool
+) -> None:
+    statement = insert(session, Group).values(
+        group_id=group_id, autodelete=False, milestones=milestones
+    )
+    await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[Group.group_id],
+            set_={"milestones": statement.excluded.milestones},
+        )
+    )
+
+
+async def set_user_milestones(
+    session: AsyncSession, user_id: int, milestones: bool
+) -> None:
+    await session.execute(
+        update(Users)
+        .where(Users.user_id == user_id)
+        .values(milestones=milestones)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def claim_milestone(
+    session: AsyncSession,
+    chat_id: int,
+    user_id: int,
+    streak: datetime.datetime,
+    milestone: int,
+    now: datetime.datetime,
+) -> bool:
+    """Records a milestone congratulation. False if it was already sent."""
+    statement = insert(session, MilestoneNotification).values(
+        chat_id=chat_id,
+        user_id=user_id,
+        streak=streak,
+        milestone=milestone,
+        sent_at=now,
+    )
+    claimed = await session.scalar(
+        statement.on_conflict_do_nothing().returning(MilestoneNotification.chat_id)
+    )
+    return claimed is not None
+
+
+async def delete_users(session: AsyncSession, user_ids: Sequence[int]) -> None:
+    """Erases everything stored about `user_ids`."""
+    for model in (
+        Users,
+        GroupUser,
+        RelapseEvent,
+        UserStats,
+        GlobalLeaderboard,
+        MilestoneNotification,
+    ):
+        await session.execute(delete(model).where(model.user_id.in_(user_ids)))
+
+
+async def save_checkpoint(
+    session: AsyncSession,
+    name: str,
+    group_id: Optional[int],
+    user_id: Optional[int],
+    finished_at: Optional[datetime.datetime],
+) -> None:
+    statement = insert(session, JobCheckpoint).values(
+        name=name, group_id=group_id, user_id=user_id, finished_at=finished_at
+    )
+    await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[JobCheckpoint.name],
+            set_={
+                "group_id": statement.excluded.group_id,
+                "user_id": statement.excluded.user_id,
+                "finished_at": statement.excluded.finished_at,
+            },
+        )
+    )
+
+
+async def set_has_left(
+    session: AsyncSession, members: Sequence[Tuple[int, int]], has_left: bool
+) -> List[Tuple[int, int]]:
+    """Marks (group_id, user_id) memberships as left or present again and
+    returns the ones that actually changed."""
+    if not members:
+        return []
+    result = await session.execute(
+        update(GroupUser)
+        .where(
+            tuple_(GroupUser.group_id, GroupUser.user_id).in_(members),
+            GroupUser.has_left != has_left,
+        )
+        .values(has_left=has_left)
+        .returning(GroupUser.group_id, GroupUser.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    return [(group_id, user_id) for group_id, user_id in result]
+
+
+async def save_live_scoreboard(
+    session: AsyncSession, chat_id: int, message_id: int, owner: int
+) -> None:
+    """Makes `message_id` the live scoreboard of `chat_id`."""
+    statement = insert(session, LiveScoreboard).values(
+        chat_id=chat_id,
+        message_id=message_id,
+        owner=owner,
+        last_rendered_hash=None,
+        next_due=None,
+    )
+    await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[LiveScoreboard.chat_id],
+            set_={
+                "message_id": statement.excluded.message_id,
+                "owner": statement.excluded.owner,
+                "last_rendered_hash": None,
+                "next_due": None,
+            },
+        )
+    )
+
+
+async def update_live_scoreboard(
+    session: AsyncSession,
+    chat_id: int,
+    message_id: int,
+    last_rendered_hash: Optional[str],
+    next_due: Optional[datetime.datetime],
+) -> None:
+    await session.execute(
+        update(LiveScoreboard)
+        .where(
+            LiveScoreboard.chat_id == chat_id,
+            LiveScoreboard.message_id == message_id,
+        )
+        .values(last_rendered_hash=last_rendered_hash, next_due=next_due)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def delete_live_scoreboard(
+    session: AsyncSession, chat_id: int, message_id: int
+) -> None:
+    await session.execute(
+        delete(LiveScoreboard).where(
+            LiveScoreboard.chat_id == chat_id,
+            LiveScoreboard.message_id == message_id,
+        )
+    )
+
+
+async def heartbeat(
+    session: AsyncSession,
+    instance_id: str,
+    expires_at: datetime.datetime,
+    now: datetime.datetime,
+) -> List[str]:
+    """Keeps `instance_id` in the cluster until `expires_at` and returns the
+    members that are alive at `now`, itself included."""
+    statement = insert(session, ClusterMember).values(
+        instance_id=instance_id, expires_at=expires_at
+    )
+    await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[ClusterMember.instance_id],
+            set_={"expires_at": statement.excluded.expires_at},
+        )
+    )
+    await session.execute(delete(ClusterMember).where(ClusterMember.expires_at < now))
+    return list(
+        await session.scalars(
+            select(ClusterMember.instance_id).order_by(ClusterMember.instance_id)
+        )
+    )
+
+
+async def leave_cluster(session: AsyncSession, instance_id: str) -> None:
+    await session.execute(delete(ShardLease).where(ShardLease.owner == instance_id))
+    await session.execute(
+        delete(ClusterMember).where(ClusterMember.instance_id == instance_id)
+    )
+
+
+async def claim_shard(
+    session: AsyncSession,
+    shard: int,
+    owner: str,
+    expires_at: datetime.datetime,
+    now: datetime.datetime,
+) -> bool:
+    """Takes or renews the lease of `shard`. Returns False while another
+    process holds an unexpired lease."""
+    statement = insert(session, ShardLease).values(
+        shard=shard, owner=owner, expires_at=expires_at
+    )
+    claimed = await session.scalar(
+        statement.on_conflict_do_update(
+            index_elements=[ShardLease.shard],
+            set_={
+                "owner": statement.excluded.owner,
+                "expires_at": statement.excluded.expires_at,
+            },
+            where=(ShardLease.owner == owner) | (ShardLease.expires_at < now),
+        ).returning(ShardLease.shard)
+    )
+    return claimed is not None
+
+
+async def release_shards(
+    session: AsyncSession, shards: Sequence[int], owner: str
+) -> None:
+    await session.execute(
+        delete(ShardLease).where(
+            ShardLease.shard.in_(shards), ShardLease.owner == owner
+        )
+    )
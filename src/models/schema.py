@@ -0,0 +1,62 @@
+import logging
+from typing import Optional
+
+from sqlalchemy import Column, MetaData, String, Table, delete, inspect, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from models.database import Base
+
+# The newest revision in alembic/versions. Bump it with every migration, the
+# bot refuses to start on a database at any other revision.
+SCHEMA_REVISION = "df067ee11899"
+
+# Alembic's own bookkeeping table, as `alembic upgrade` creates it.
+alembic_version = Table(
+    "alembic_version",
+    MetaData(),
+    Column("version_num", String(32), primary_key=True),
+)
+
+
+async def current_revision(engine: AsyncEngine) -> Optional[str]:
+    """The revision the database is at, None if Alembic never touched it."""
+    conn: AsyncConnection
+    async with engine.connect() as conn:
+        try:
+            return (await conn.execute(select(alembic_version.c.version_num))).scalar()
+        except DBAPIError:
+            return None
+
+
+async def prepare_schema(engine: AsyncEngine) -> None:
+    """Makes sure the database has the schema of the models.
+
+    A migrated database costs a single query. An empty one gets every table
+    at once and is stamped with SCHEMA_REVISION, so `alembic upgrade head`
+    continues from there. Any other database, PostgreSQL or SQLite, is left
+    to Alembic: `create_all` would add missing tables but not the columns
+    that migrations add to existing ones.
+    """
+    revision = await current_revision(engine)
+    if revision == SCHEMA_REVISION:
+        return
+    if revision is not None:
+        raise RuntimeError(
+            f"The database is at revision {revision}, the bot needs "
+            f"{SCHEMA_REVISION}. Run `alembic upgrade head`."
+        )
+    conn: AsyncConnection
+    async with engine.begin() as conn:
+        tables = await conn.run_sync(lambda sync: inspect(sync).get_table_names())
+        if set(tables) - {alembic_version.name}:
+            raise RuntimeError(
+                "The database has tables but no Alembic revision. Stamp it "
+                "with the revision it is at (`alembic stamp <revision>`) "
+                "and run `alembic upgrade head`."
+            )
+        logging.info("Creating the schema at revision %s", SCHEMA_REVISION)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(alembic_version.create, checkfirst=True)
+        await conn.execute(delete(alembic_version))
+        await conn.execute(alembic_version.insert().values(version_num=SCHEMA_REVISION))
@@ -0,0 +1,38 @@
+import logging
+from typing import Any, Callable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+_CALLBACKS = "after_commit"
+
+
+def after_commit(session: AsyncSession, callback: Callable[[], Any]) -> None:
+    """Calls `callback` once the transaction of `session` is committed, and
+    never if it is rolled back. For in-memory state that mirrors a write:
+    rankings, caches and dirty marks."""
+    session.info.setdefault(_CALLBACKS, []).append(callback)
+
+
+async def commit(session: AsyncSession) -> None:
+    """Ends the transaction of a handler, committing what it wrote so far.
+    Handlers call it before talking to the Bot API, also after only reading,
+    so a failing request doesn't roll a write back and no locks or
+    connections are held while requests wait for the limiter."""
+    if session.in_transaction():
+        await session.commit()
+
+
+@event.listens_for(Session, "after_commit")
+def _run_callbacks(session: Session) -> None:
+    for callback in session.info.pop(_CALLBACKS, []):
+        try:
+            callback()
+        except Exception:
+            logging.exception("After-commit callback failed")
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_callbacks(session: Session, previous_transaction: Any) -> None:
+    session.info.pop(_CALLBACKS, None)
@@ -0,0 +1,70 @@
+from typing import Any
+
+from sqlalchemy import Integer
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+def insert(session: AsyncSession, entity: Any) -> Any:
+    """An INSERT with ON CONFLICT support for the database of `session`.
+
+    PostgreSQL and SQLite share the same `on_conflict_do_*` API.
+    """
+    if session.bind.dialect.name == "sqlite":
+        return sqlite.insert(entity)
+    return postgresql.insert(entity)
+
+
+class days_since(FunctionElement):
+    """Whole days between a timestamp and `now`, like `timedelta.days`.
+
+    `now` is passed in from Python because streaks are stored as naive
+    local timestamps of the bot, not of the database server.
+    """
+
+    type = Integer()
+    name = "days_since"
+    inherit_cache = True
+
+
+@compiles(days_since)
+def _compile_days_since(element, compiler, **kw):
+    timestamp, now = list(element.clauses)
+    return (
+        "CAST(floor(extract(epoch FROM CAST(%s AS TIMESTAMP) - %s) / 86400) AS INTEGER)"
+    ) % (
+        compiler.process(now, **kw),
+        compiler.process(timestamp, **kw),
+    )
+
+
+@compiles(days_since, "sqlite")
+def _compile_days_since_sqlite(element, compiler, **kw):
+    timestamp, now = list(element.clauses)
+    # Rounded to milliseconds first, julianday() is a float.
+    return (
+        "CAST(round((julianday(%s) - julianday(%s)) * 86400000) AS INTEGER)"
+        " / 86400000"
+    ) % (
+        compiler.process(now, **kw),
+        compiler.process(timestamp, **kw),
+    )
+
+
+class greatest(FunctionElement):
+    """The largest of its arguments, `max()` on SQLite."""
+
+    name = "greatest"
+    inherit_cache = True
+
+
+@compiles(greatest)
+def _compile_greatest(element, compiler, **kw):
+    return "greatest(%s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(greatest, "sqlite")
+def _compile_greatest_sqlite(element, compiler, **kw):
+    return "max(%s)" % compiler.process(element.clauses, **kw)
@@ -0,0 +1,206 @@
+import asyncio
+import datetime
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from kink import di
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.database import PendingDeletion
+from services.cluster import Shards
+from services.outbound import Priority, outbound_priority
+
+# deleteMessages accepts at most this many message ids per call.
+DELETE_MESSAGES_LIMIT = 100
+
+
+class DeletionQueue:
+    """Deletes messages after a delay, surviving restarts.
+
+    Handlers only hand message ids over. A flusher stores them in
+    `pending_deletion` right away, at most once every `flush_interval`
+    seconds. A consumer deletes due messages in batches and removes the rows
+    afterwards. Only the messages of chats in the owned `shards` are deleted
+    here.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        delay: float,
+        batch_size: int = 500,
+        idle_timeout: float = 60,
+        flush_interval: float = 1,
+        shards: Optional[Shards] = None,
+    ) -> None:
+        self._bot = bot
+        self._shards = shards or Shards()
+        self._delay = datetime.timedelta(seconds=delay)
+        self._batch_size = batch_size
+        self._idle_timeout = idle_timeout
+        self._flush_interval = flush_interval
+        self._incoming: List[Tuple[int, int, datetime.datetime]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._flush_wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._flush()),
+            asyncio.create_task(self._consume()),
+        ]
+        # Other processes may have queued messages of the owned shards.
+        self._shards.subscribe(self._wake_up)
+
+    async def stop(self) -> None:
+        if not self._tasks:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._store_incoming()
+
+    async def enqueue(self, chat_id: int, *message_ids: int) -> None:
+        # Stored by the flusher rather than here: the handler calling this
+        # may hold an open write transaction, and on SQLite a second writer
+        # can only wait for it until the busy timeout runs out.
+        due_at = datetime.datetime.now() + self._delay
+        self._incoming.extend(
+            (chat_id, message_id, due_at) for message_id in message_ids
+        )
+        if self._flush_wakeup is not None:
+            self._flush_wakeup.set()
+
+    async def backlog(self) -> int:
+        """Messages waiting to be deleted, due or not."""
+        session: AsyncSession
+        async with di["async_session"]() as session:
+            stored = await session.scalar(
+                select(func.count()).select_from(PendingDeletion)
+            )
+        return stored + len(self._incoming)
+
+    async def _wake_up(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _store_incoming(self) -> None:
+        if not self._incoming:
+            return
+        incoming, self._incoming = self._incoming, []
+        session: AsyncSession
+        try:
+            async with di["async_session"]() as session:
+                session.add_all(
+                    PendingDeletion(
+                        chat_id=chat_id, message_id=message_id, due_at=due_at
+                    )
+                    for chat_id, message_id, due_at in incoming
+                )
+                await session.commit()
+        except Exception:
+            self._incoming[:0] = incoming
+            raise
+
+    async def _flush(self) -> None:
+        while True:
+            await self._flush_wakeup.wait()
+            self._flush_wakeup.clear()
+            try:
+                await self._store_incoming()
+            except Exception:
+                logging.exception("Failed to store pending deletions")
+                self._flush_wakeup.set()
+            else:
+                # The consumer may be asleep until a later deadline.
+                self._wakeup.set()
+            # Enqueues arriving meanwhile are stored together.
+            await asyncio.sleep(self._flush_interval)
+
+    async def _consume(self) -> None:
+        outbound_priority.set(Priority.BACKGROUND)
+        while True:
+            # Cleared before looking at the table, so an enqueue that happens
+            # while a batch is being processed still wakes the consumer.
+            self._wakeup.clear()
+            try:
+                timeout = await self._process_due()
+            except Exception:
+                logging.exception("Failed to process pending deletions")
+                timeout = self._idle_timeout
+            if timeout <= 0:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _process_due(self) -> float:
+        """Deletes one batch of due messages and returns how long to sleep."""
+        now = datetime.datetime.now()
+        session: AsyncSession
+        async with di["async_session"]() as session:
+            rows = (
+                await session.execute(
+                    select(
+                        PendingDeletion.id,
+                        PendingDeletion.chat_id,
+                        PendingDeletion.message_id,
+                    )
+                    .where(
+                        PendingDeletion.due_at <= now,
+                        self._shards.where(PendingDeletion.chat_id),
+                    )
+                    .order_by(PendingDeletion.due_at)
+                    .limit(self._batch_size)
+                )
+            ).all()
+            if not rows:
+                next_due = await session.scalar(
+                    select(func.min(PendingDeletion.due_at)).where(
+                        self._shards.where(PendingDeletion.chat_id)
+                    )
+                )
+                if next_due is None:
+                    return self._idle_timeout
+                return min((next_due - now).total_seconds(), self._idle_timeout)
+
+        # Sent after the session is closed. A crash before the rows are
+        # removed deletes the messages again, which Telegram refuses
+        # harmlessly.
+        by_chat: Dict[int, List[int]] = {}
+        for row in rows:
+            by_chat.setdefault(row.chat_id, []).append(row.message_id)
+        for chat_id, message_ids in by_chat.items():
+            await self._delete_messages(chat_id, message_ids)
+        async with di["async_session"]() as session:
+            await session.execute(
+                delete(PendingDeletion).where(
+                    PendingDeletion.id.in_([row.id for row in rows])
+                )
+            )
+            await session.commit()
+        return 0
+
+    async def _delete_messages(self, chat_id: int, message_ids: List[int]) -> None:
+        delete_messages = getattr(self._bot, "delete_messages", None)
+        if delete_messages is not None:
+            for start in range(0, len(message_ids), DELETE_MESSAGES_LIMIT):
+                try:
+                    await delete_messages(
+                        chat_id, message_ids[start : start + DELETE_MESSAGES_LIMIT]
+                    )
+                except TelegramAPIError:
+                    pass
+            return
+        for message_id in message_ids:
+            try:
+                await self._bot.delete_message(chat_id, message_id)
+            except TelegramAPIError:
+                pass
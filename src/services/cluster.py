@@ -0,0 +1,164 @@
+import asyncio
+import datetime
+import hashlib
+import logging
+import time
+from typing import Awaitable, Callable, FrozenSet, List, Optional, Sequence
+
+from kink import di
+from sqlalchemy import false, func, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import ColumnElement
+
+from models.repository import claim_shard, heartbeat, leave_cluster, release_shards
+
+Listener = Callable[[], Awaitable[None]]
+
+
+def shard_of(chat_id: int, count: int) -> int:
+    return abs(chat_id) % count
+
+
+def rendezvous_owner(shard: int, members: Sequence[str]) -> str:
+    """The member a shard belongs to. Every process computes the same answer
+    from the same member list, and only the shards of a member that joins or
+    leaves move."""
+    return max(
+        members,
+        key=lambda member: hashlib.sha256(f"{member}:{shard}".encode()).digest(),
+    )
+
+
+class Shards:
+    """Background work split by chat into shards.
+
+    This process alone: it owns the only shard.
+    """
+
+    count = 1
+    clustered = False
+
+    def __init__(self) -> None:
+        self._listeners: List[Listener] = []
+
+    @property
+    def owned(self) -> FrozenSet[int]:
+        return frozenset({0})
+
+    def owns(self, chat_id: int) -> bool:
+        return shard_of(chat_id, self.count) in self.owned
+
+    def where(self, chat_id: ColumnElement) -> ColumnElement:
+        """A filter for the rows of the chats of the owned shards."""
+        owned = self.owned
+        if len(owned) == self.count:
+            return true()
+        if not owned:
+            return false()
+        return (func.abs(chat_id) % self.count).in_(sorted(owned))
+
+    def subscribe(self, listener: Listener) -> None:
+        """Calls `listener` after every lease round, i.e. whenever work of
+        other processes may have shown up in the owned shards."""
+        self._listeners.append(listener)
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class ShardLeases(Shards):
+    """Shards claimed through lease rows shared by every process.
+
+    Every `ttl / 3` seconds a process renews its membership in
+    `cluster_member`, works out which shards are its own by rendezvous
+    hashing over the live members and claims or renews their leases in
+    `shard_lease`. Shards it should no longer own are released. A process
+    that dies stops renewing, and after `ttl` its shards go to the others.
+
+    Leases are compared against the clocks of the processes, keep them in
+    sync.
+    """
+
+    clustered = True
+
+    def __init__(self, instance_id: str, count: int, ttl: float = 30) -> None:
+        super().__init__()
+        self.instance_id = instance_id
+        self.count = count
+        self._ttl = datetime.timedelta(seconds=ttl)
+        self._owned: FrozenSet[int] = frozenset()
+        # Work stops when the leases may have run out, even if the database
+        # can't be reached to release them.
+        self._valid_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def owned(self) -> FrozenSet[int]:
+        if time.monotonic() >= self._valid_until:
+            return frozenset()
+        return self._owned
+
+    async def start(self) -> None:
+        await self._renew()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._owned = frozenset()
+        session: AsyncSession
+        async with di["async_session"]() as session:
+            await leave_cluster(session, self.instance_id)
+            await session.commit()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._ttl.total_seconds() / 3)
+            try:
+                await self._renew()
+            except Exception:
+                logging.exception("Failed to renew shard leases")
+                continue
+            for listener in self._listeners:
+                try:
+                    await listener()
+                except Exception:
+                    logging.exception("Shard listener failed")
+
+    async def _renew(self) -> None:
+        started = time.monotonic()
+        now = datetime.datetime.utcnow()
+        expires_at = now + self._ttl
+        session: AsyncSession
+        async with di["async_session"]() as session:
+            members = await heartbeat(session, self.instance_id, expires_at, now)
+            wanted = {
+                shard
+                for shard in range(self.count)
+                if rendezvous_owner(shard, members) == self.instance_id
+            }
+            released = self._owned - wanted
+            # Stop working on them before another process can claim them.
+            self._owned -= released
+            await release_shards(session, sorted(released), self.instance_id)
+            owned = set()
+            for shard in sorted(wanted):
+                # Fails while the previous owner still holds the lease; it
+                # releases it on its next round or lets it expire.
+                if await claim_shard(session, shard, self.instance_id, expires_at, now):
+                    owned.add(shard)
+            await session.commit()
+        if owned != self._owned:
+            logging.info(
+                "Owning %d of %d shards with %d members",
+                len(owned),
+                self.count,
+                len(members),
+            )
+        self._owned = frozenset(owned)
+        self._valid_until = started + self._ttl.total_seconds()
@@ -0,0 +1,110 @@
+import datetime
+from typing import List, NamedTuple, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.database import RelapseEvent, UserStats
+
+TREND_WINDOW = datetime.timedelta(days=30)
+
+
+def roll_window(
+    window_start: datetime.datetime,
+    window_relapses: int,
+    previous_window_relapses: int,
+    now: datetime.datetime,
+) -> Tuple[datetime.datetime, int, int]:
+    """Moves the 30-day trend windows forward so the current one contains
+    `now`. Returns the new (window_start, window, previous window)."""
+    windows_passed = (now - window_start) // TREND_WINDOW
+    if windows_passed <= 0:
+        return window_start, window_relapses, previous_window_relapses
+    window_start += windows_passed * TREND_WINDOW
+    if windows_passed == 1:
+        return window_start, 0, window_relapses
+    return window_start, 0, 0
+
+
+async def record_relapse(
+    session: AsyncSession,
+    user_id: int,
+    streak_started: datetime.datetime,
+    relapsed_at: datetime.datetime,
+    days: int,
+) -> None:
+    """Appends a relapse to the history and folds it into the aggregates."""
+    session.add(
+        RelapseEvent(
+            user_id=user_id,
+            streak_started=streak_started,
+            relapsed_at=relapsed_at,
+            days=days,
+        )
+    )
+    stats = await session.get(UserStats, user_id)
+    if stats is None:
+        stats = UserStats(
+            user_id=user_id,
+            tracking_since=streak_started,
+            relapses=0,
+            total_days=0,
+            longest_streak=0,
+            window_start=relapsed_at,
+            window_relapses=0,
+            previous_window_relapses=0,
+        )
+        session.add(stats)
+    (
+        stats.window_start,
+        stats.window_relapses,
+        stats.previous_window_relapses,
+    ) = roll_window(
+        stats.window_start,
+        stats.window_relapses,
+        stats.previous_window_relapses,
+        relapsed_at,
+    )
+    stats.relapses += 1
+    stats.total_days += days
+    stats.longest_streak = max(stats.longest_streak, days)
+    stats.last_relapse_at = relapsed_at
+    stats.window_relapses += 1
+
+
+async def fetch_recent_relapses(
+    session: AsyncSession, user_id: int, limit: int
+) -> List[RelapseEvent]:
+    return (
+        await session.scalars(
+            select(RelapseEvent)
+            .where(RelapseEvent.user_id == user_id)
+            .order_by(RelapseEvent.relapsed_at.desc())
+            .limit(limit)
+        )
+    ).all()
+
+
+class StatsSummary(NamedTuple):
+    average_streak: float
+    longest_streak: int
+    relapses_per_month: float
+    window_relapses: int
+    previous_window_relapses: int
+
+
+def summarize(stats: UserStats, now: datetime.datetime) -> StatsSummary:
+    _, window_relapses, previous_window_relapses = roll_window(
+        stats.window_start,
+        stats.window_relapses,
+        stats.previous_window_relapses,
+        now,
+    )
+    tracked_windows = max((now - stats.tracking_since) / TREND_WINDOW, 1)
+    return StatsSummary(
+        average_streak=stats.total_days / stats.relapses,
+        longest_streak=stats.longest_streak,
+        relapses_per_month=stats.relapses / tracked_windows,
+        window_relapses=window_relapses,
+        previous_window_relapses=previous_window_relapses,
+    )
@@ -0,0 +1,153 @@
+import bisect
+import datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+from kink import di
+from sqlalchemy import delete, exists, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.database import GlobalLeaderboard, GroupUser, Users
+from models.session import after_commit
+from models.sql import days_since, insert
+
+Key = Tuple[datetime.datetime, int]
+
+
+class GlobalRanking:
+    """Sorted in-memory copy of `global_leaderboard`.
+
+    Looking up the rank of a user is a binary search instead of counting
+    every row with a longer streak.
+    """
+
+    def __init__(self) -> None:
+        self._keys: List[Key] = []
+        self._streaks: Dict[int, datetime.datetime] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    async def load(self, session: AsyncSession) -> None:
+        rows = (
+            await session.execute(
+                select(GlobalLeaderboard.streak, GlobalLeaderboard.user_id).order_by(
+                    GlobalLeaderboard.streak, GlobalLeaderboard.user_id
+                )
+            )
+        ).all()
+        self._keys = [(streak, user_id) for streak, user_id in rows]
+        self._streaks = {user_id: streak for streak, user_id in rows}
+
+    def rank(self, user_id: int) -> Optional[int]:
+        streak = self._streaks.get(user_id)
+        if streak is None:
+            return None
+        return bisect.bisect_left(self._keys, (streak, user_id)) + 1
+
+    async def lookup(
+        self, session: AsyncSession, user_id: int
+    ) -> Tuple[Optional[int], int]:
+        """The rank of `user_id` (None if unranked) and the number of ranked
+        users."""
+        return self.rank(user_id), len(self)
+
+    def put(self, user_id: int, streak: datetime.datetime) -> None:
+        self.discard(user_id)
+        bisect.insort(self._keys, (streak, user_id))
+        self._streaks[user_id] = streak
+
+    def discard(self, user_id: int) -> None:
+        streak = self._streaks.pop(user_id, None)
+        if streak is None:
+            return
+        index = bisect.bisect_left(self._keys, (streak, user_id))
+        del self._keys[index]
+
+
+class DatabaseRanking:
+    """Ranks read from `global_leaderboard` on every lookup.
+
+    Used when several processes share the database: the others change
+    streaks too, and keeping a copy in sync would mean re-reading the whole
+    table over and over. A rank is a count of the keys before the user's,
+    served by `ix_global_leaderboard_streak`.
+    """
+
+    async def load(self, session: AsyncSession) -> None:
+        pass
+
+    def put(self, user_id: int, streak: datetime.datetime) -> None:
+        pass
+
+    def discard(self, user_id: int) -> None:
+        pass
+
+    async def lookup(
+        self, session: AsyncSession, user_id: int
+    ) -> Tuple[Optional[int], int]:
+        total = await session.scalar(
+            select(func.count()).select_from(GlobalLeaderboard)
+        )
+        streak = await session.scalar(
+            select(GlobalLeaderboard.streak).where(GlobalLeaderboard.user_id == user_id)
+        )
+        if streak is None:
+            return None, total
+        before = await session.scalar(
+            select(func.count()).where(
+                tuple_(GlobalLeaderboard.streak, GlobalLeaderboard.user_id)
+                < tuple_(streak, user_id)
+            )
+        )
+        return before + 1, total
+
+
+async def sync_global_leaderboard(session: AsyncSession, user_id: int) -> None:
+    """Brings the global leaderboard row of `user_id` up to date after a
+    write to their streak or scoreboard membership. The in-memory ranking
+    follows once the transaction of `session` commits."""
+    ranking: Union[GlobalRanking, DatabaseRanking] = di["global_ranking"]
+    streak = await session.scalar(
+        select(Users.streak).where(
+            Users.user_id == user_id,
+            exists().where(
+                GroupUser.user_id == Users.user_id,
+                GroupUser.is_banned == False,
+                GroupUser.has_left == False,
+            ),
+        )
+    )
+    if streak is None:
+        await session.execute(
+            delete(GlobalLeaderboard).where(GlobalLeaderboard.user_id == user_id)
+        )
+        after_commit(session, lambda: ranking.discard(user_id))
+        return
+    statement = insert(session, GlobalLeaderboard).values(
+        user_id=user_id, streak=streak
+    )
+    await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[GlobalLeaderboard.user_id],
+            set_={"streak": statement.excluded.streak},
+        )
+    )
+    after_commit(session, lambda: ranking.put(user_id, streak))
+
+
+async def fetch_global_top(
+    session: AsyncSession, limit: int, now: datetime.datetime
+) -> List:
+    return (
+        await session.execute(
+            select(
+                Users.user_id,
+                Users.name,
+                Users.username,
+                days_since(Users.streak, now).label("days"),
+            )
+            .join(GlobalLeaderboard, GlobalLeaderboard.user_id == Users.user_id)
+            .order_by(GlobalLeaderboard.streak, GlobalLeaderboard.user_id)
+            .limit(limit)
+        )
+    ).all()
@@ -0,0 +1,333 @@
+import bisect
+import inspect
+import logging
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    TYPE_CHECKING,
+    List,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import TelegramMethod
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+    from services.cache import LRUCache
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+Sample = Tuple[str, Tuple[Tuple[str, str], ...], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, labelvalues: Sequence[Any]) -> Tuple[Tuple[str, str], ...]:
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(zip(self.labelnames, map(str, labelvalues)))
+
+    async def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+
+    def inc(self, *labelvalues: Any, amount: float = 1) -> None:
+        labels = self._labels(labelvalues)
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    async def samples(self) -> List[Sample]:
+        return [(self.name, labels, value) for labels, value in self._values.items()]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[Tuple[str, str], ...], List[Any]] = {}
+
+    def observe(self, value: float, *labelvalues: Any) -> None:
+        labels = self._labels(labelvalues)
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[0][index] += 1
+        state[1] += value
+        state[2] += 1
+
+    async def samples(self) -> List[Sample]:
+        samples = []
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append(
+                    (
+                        f"{self.name}_bucket",
+                        labels + (("le", _format_value(bound)),),
+                        cumulative,
+                    )
+                )
+            samples.append((f"{self.name}_bucket", labels + (("le", "+Inf"),), count))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class Gauge(Metric):
+    """A value read at scrape time. The callback may be a coroutine function."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Union[float, Awaitable[float]]],
+    ) -> None:
+        super().__init__(name, documentation)
+        self._callback = callback
+
+    async def samples(self) -> List[Sample]:
+        value = self._callback()
+        if inspect.isawaitable(value):
+            value = await value
+        return [(self.name, (), value)]
+
+
+class CacheLookups(Metric):
+    """Hits and misses of `LRUCache`s, read from the caches at scrape time."""
+
+    type = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, caches: Dict[str, "LRUCache"]
+    ) -> None:
+        super().__init__(name, documentation, ["cache", "result"])
+        self._caches = caches
+
+    async def samples(self) -> List[Sample]:
+        samples = []
+        for cache_name, cache in self._caches.items():
+            samples.append((self.name, self._labels((cache_name, "hit")), cache.hits))
+            samples.append(
+                (self.name, self._labels((cache_name, "miss")), cache.misses)
+            )
+        return samples
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def __iter__(self) -> Iterator[Metric]:
+        return iter(self._metrics.values())
+
+    async def render(self) -> str:
+        """Everything in the Prometheus text exposition format."""
+        lines = []
+        for metric in self:
+            try:
+                samples = await metric.samples()
+            except Exception:
+                logging.exception("Failed to collect %s", metric.name)
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                if labels:
+                    rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                    name = f"{name}{{{rendered}}}"
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_DURATION = registry.register(
+    Histogram(
+        "streakbot_handler_duration_seconds",
+        "Time spent in a handler.",
+        ["handler"],
+    )
+)
+HANDLER_ERRORS = registry.register(
+    Counter(
+        "streakbot_handler_errors_total",
+        "Handlers that raised an exception.",
+        ["handler"],
+    )
+)
+DB_QUERY_DURATION = registry.register(
+    Histogram(
+        "streakbot_db_query_duration_seconds",
+        "Time spent executing SQL statements, by statement type.",
+        ["statement"],
+    )
+)
+DB_QUERY_ERRORS = registry.register(
+    Counter(
+        "streakbot_db_query_errors_total",
+        "SQL statements that failed, by statement type.",
+        ["statement"],
+    )
+)
+DB_POOL_CHECKOUT_WAIT = registry.register(
+    Histogram(
+        "streakbot_db_pool_checkout_wait_seconds",
+        "Time spent waiting for a connection from the pool.",
+        buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+    )
+)
+TELEGRAM_REQUEST_DURATION = registry.register(
+    Histogram(
+        "streakbot_telegram_request_duration_seconds",
+        "Bot API call latency, by method.",
+        ["method"],
+    )
+)
+TELEGRAM_REQUEST_ERRORS = registry.register(
+    Counter(
+        "streakbot_telegram_request_errors_total",
+        "Bot API calls that failed, by method and error.",
+        ["method", "error"],
+    )
+)
+
+
+def statement_type(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Times every statement executed through `engine` (a sync engine, pass
+    `async_engine.sync_engine`)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, *args: Any) -> None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, *args: Any) -> None:
+        started = conn.info["query_started"].pop()
+        DB_QUERY_DURATION.observe(
+            time.perf_counter() - started, statement_type(statement)
+        )
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context) -> None:
+        started = (
+            context.connection.info.get("query_started") if context.connection else None
+        )
+        if started:
+            started.pop()
+        DB_QUERY_ERRORS.inc(statement_type(context.statement or ""))
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """The default pool of async engines, recording how long checkouts wait."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+
+class BotAPIMetrics(BaseRequestMiddleware):
+    """Records the latency and the errors of every Bot API call. Register it
+    after the `OutboundLimiter`, so waiting for a token is not counted."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Any:
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_REQUEST_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_REQUEST_DURATION.observe(time.perf_counter() - started, name)
+
+
+async def run_metrics_server(host: str, port: int) -> "web.AppRunner":
+    # aiohttp.web is only needed when metrics are served.
+    from aiohttp import web
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(
+            text=await registry.render(),
+            content_type="text/plain",
+            charset="utf-8",
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info("Serving metrics on http://%s:%d/metrics", host, port)
+    return runner
@@ -0,0 +1,180 @@
+import asyncio
+import datetime
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from kink import di
+from sqlalchemy import exists, false, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from messages import get_group_milestone_text, get_milestone_text
+from models.database import Group, GroupUser, MilestoneNotification, Users
+from models.repository import claim_milestone
+from services.cluster import Shards
+from services.outbound import Priority, TokenBucket, outbound_priority
+
+
+def crossed(
+    milestone: int, now: datetime.datetime, window: datetime.timedelta
+) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Streaks that reached `milestone` days in the `window` before `now`
+    started in (first, last]."""
+    last = now - datetime.timedelta(days=milestone)
+    return last - window, last
+
+
+def not_notified(chat_id, milestone: int):
+    return ~exists().where(
+        MilestoneNotification.chat_id == chat_id,
+        MilestoneNotification.user_id == Users.user_id,
+        MilestoneNotification.streak == Users.streak,
+        MilestoneNotification.milestone == milestone,
+    )
+
+
+class MilestoneNotifier:
+    """Congratulates users whose streak reached one of the `milestones`.
+
+    Every `interval` seconds it looks for streaks that crossed a milestone
+    within the last `window`, one range scan of `ix_users_streak` per
+    milestone. Users that opted in are congratulated in the private chat,
+    scoreboard members in the groups that opted in. A streak that crossed
+    longer ago (after a downtime) is not congratulated late.
+
+    Every congratulation is recorded in `milestone_notification` before it
+    is sent, so a restart never sends one twice; one that was being sent
+    may get lost. Messages go out at `rate` per second, `batch_size` are
+    claimed at a time. Only chats of the owned `shards` are handled.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        milestones: Sequence[int],
+        rate: float,
+        batch_size: int = 100,
+        interval: float = 300,
+        window: float = 86400,
+        shards: Optional[Shards] = None,
+    ) -> None:
+        self._bot = bot
+        self._milestones = sorted(milestones)
+        self._budget = TokenBucket(rate, 1)
+        self._batch_size = batch_size
+        self._interval = interval
+        self._window = datetime.timedelta(seconds=window)
+        self._shards = shards or Shards()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        outbound_priority.set(Priority.BACKGROUND)
+        while True:
+            try:
+                sent = await self.notify(datetime.datetime.now())
+                if sent:
+                    logging.info("Sent %d milestone congratulations", sent)
+            except Exception:
+                logging.exception("Failed to send milestone congratulations")
+            await asyncio.sleep(self._interval)
+
+    async def notify(self, now: datetime.datetime) -> int:
+        """Sends every congratulation due at `now`, returns how many."""
+        sent = 0
+        for milestone in self._milestones:
+            while True:
+                messages, complete = await self._claim_batch(milestone, now)
+                for chat_id, text in messages:
+                    sent += await self._send(chat_id, text)
+                if complete:
+                    break
+        return sent
+
+    async def _claim_batch(
+        self, milestone: int, now: datetime.datetime
+    ) -> Tuple[List[Tuple[int, str]], bool]:
+        """Claims up to `batch_size` private and group congratulations. The
+        flag tells if no more are left."""
+        first, last = crossed(milestone, now, self._window)
+        messages = []
+        session: AsyncSession
+        async with di["async_session"]() as session:
+            private = (
+                await session.execute(
+                    select(Users.user_id, Users.streak)
+                    .where(
+                        Users.streak > first,
+                        Users.streak <= last,
+                        Users.milestones == true(),
+                        self._shards.where(Users.user_id),
+                        not_notified(Users.user_id, milestone),
+                    )
+                    .order_by(Users.streak, Users.user_id)
+                    .limit(self._batch_size)
+                )
+            ).all()
+            groups = (
+                await session.execute(
+                    select(
+                        GroupUser.group_id,
+                        Users.user_id,
+                        Users.name,
+                        Users.username,
+                        Users.streak,
+                    )
+                    .join(GroupUser, GroupUser.user_id == Users.user_id)
+                    .join(Group, Group.group_id == GroupUser.group_id)
+                    .where(
+                        Users.streak > first,
+                        Users.streak <= last,
+                        Group.milestones == true(),
+                        GroupUser.is_banned == false(),
+                        GroupUser.has_left == false(),
+                        self._shards.where(GroupUser.group_id),
+                        not_notified(GroupUser.group_id, milestone),
+                    )
+                    .order_by(Users.streak, Users.user_id, GroupUser.group_id)
+                    .limit(self._batch_size)
+                )
+            ).all()
+            for user_id, streak in private:
+                if await claim_milestone(
+                    session, user_id, user_id, streak, milestone, now
+                ):
+                    messages.append((user_id, get_milestone_text(milestone)))
+            for group_id, user_id, name, username, streak in groups:
+                if await claim_milestone(
+                    session, group_id, user_id, streak, milestone, now
+                ):
+                    messages.append(
+                        (
+                            group_id,
+                            get_group_milestone_text(
+                                user_id, name, username, milestone
+                            ),
+                        )
+                    )
+            await session.commit()
+        complete = len(private) < self._batch_size and len(groups) < self._batch_size
+        return messages, complete
+
+    async def _send(self, chat_id: int, text: str) -> bool:
+        await self._budget.acquire()
+        try:
+            await self._bot.send_message(chat_id, text)
+        except TelegramAPIError as e:
+            # Blocked by the user or removed from the group.
+            logging.info("Failed to congratulate in %d: %s", chat_id, e)
+            return False
+        return True
@@ -0,0 +1,211 @@
+import asyncio
+import contextvars
+import enum
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText, TelegramMethod
+
+
+class Priority(enum.IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+# Background jobs (scoreboard refreshes, autodelete) set this for their task,
+# so their requests yield to replies to users.
+outbound_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "outbound_priority", default=Priority.INTERACTIVE
+)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available."""
+        self._refill(now)
+        return max(self.blocked_until - now, (1 - self.tokens) / self.rate, 0)
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    async def acquire(self) -> None:
+        """Sleeps until a token is available and takes it."""
+        while True:
+            delay = self.delay(time.monotonic())
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        self.take(time.monotonic())
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+class _PendingEdit:
+    def __init__(self, method: EditMessageText) -> None:
+        self.method = method
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.waiters = 0
+
+
+class OutboundLimiter(BaseRequestMiddleware):
+    """Keeps outgoing Bot API calls within Telegram's flood limits.
+
+    Messages to chats spend a token from a global bucket and from a bucket
+    of their chat. Interactive requests are served before background ones,
+    an edit of a message that is still waiting for a token is replaced by a
+    newer edit of the same message, and `retry_after` answers pause the
+    affected bucket before the request is retried.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        group_rate: float = 20 / 60,
+        private_rate: float = 1,
+        max_retries: int = 3,
+        max_chat_buckets: int = 10000,
+    ) -> None:
+        self._global = TokenBucket(global_rate, global_rate)
+        self._group_rate = group_rate
+        self._private_rate = private_rate
+        self._max_retries = max_retries
+        self._max_chat_buckets = max_chat_buckets
+        self._chats: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self._pending_edits: Dict[Tuple[Any, int], _PendingEdit] = {}
+        self._interactive_waiting = 0
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Any:
+        chat_id = getattr(method, "chat_id", None)
+        # getUpdates, getChatMember and friends are not subject to the limits.
+        if chat_id is None or type(method).__name__.startswith("Get"):
+            return await make_request(bot, method)
+        if isinstance(method, EditMessageText) and method.message_id is not None:
+            return await self._coalesced_edit(make_request, bot, method, chat_id)
+        # Deleting messages only counts against the global budget.
+        if type(method).__name__.startswith("Delete"):
+            chat_id = None
+        await self._acquire(chat_id)
+        return await self._send(make_request, bot, method, chat_id)
+
+    async def _coalesced_edit(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: EditMessageText,
+        chat_id: Hashable,
+    ) -> Any:
+        key = (chat_id, method.message_id)
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            # Still waiting for a token: send only the newest text.
+            pending.method = method
+            pending.waiters += 1
+            return await pending.future
+        pending = _PendingEdit(method)
+        self._pending_edits[key] = pending
+        try:
+            await self._acquire(chat_id)
+        finally:
+            del self._pending_edits[key]
+        try:
+            response = await self._send(make_request, bot, pending.method, chat_id)
+        except Exception as e:
+            if pending.waiters:
+                pending.future.set_exception(e)
+            raise
+        pending.future.set_result(response)
+        return response
+
+    async def _send(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+        chat_id: Optional[Hashable],
+    ) -> Any:
+        for attempt in range(self._max_retries + 1):
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self._max_retries:
+                    raise
+                if chat_id is None:
+                    self._global.block(e.retry_after)
+                else:
+                    self._chat_bucket(chat_id).block(e.retry_after)
+                await self._acquire(chat_id)
+
+    def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self._max_chat_buckets:
+                self._prune()
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            rate = self._private_rate if is_private else self._group_rate
+            # A burst of 3 keeps short exchanges snappy without breaking
+            # the per-minute limit of groups.
+            bucket = self._chats[chat_id] = TokenBucket(rate, 3)
+        self._chats.move_to_end(chat_id)
+        return bucket
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for chat_id in [c for c, b in self._chats.items() if b.is_idle(now)]:
+            del self._chats[chat_id]
+        while len(self._chats) >= self._max_chat_buckets:
+            self._chats.popitem(last=False)
+
+    async def _acquire(self, chat_id: Optional[Hashable]) -> None:
+        interactive = outbound_priority.get() is Priority.INTERACTIVE
+        waiting_on_global = False
+        try:
+            while True:
+                now = time.monotonic()
+                bucket = None if chat_id is None else self._chat_bucket(chat_id)
+                global_delay = self._global.delay(now)
+                if interactive and global_delay > 0 and not waiting_on_global:
+                    waiting_on_global = True
+                    self._interactive_waiting += 1
+                elif not interactive and self._interactive_waiting:
+                    global_delay = max(global_delay, 1 / self._global.rate)
+                delay = global_delay
+                if bucket is not None:
+                    delay = max(delay, bucket.delay(now))
+                if delay <= 0:
+                    self._global.take(now)
+                    if bucket is not None:
+                        bucket.take(now)
+                    return
+                await asyncio.sleep(delay)
+        finally:
+            if waiting_on_global:
+                self._interactive_waiting -= 1
@@ -0,0 +1,75 @@
+from typing import Any, List, Sequence, Tuple
+
+from messages import get_scoreboard_line
+from services.cache import MISSING, LRUCache
+
+# Longest text of a message, counted by Telegram after entities are parsed.
+MESSAGE_LIMIT = 4096
+
+
+def text_length(text: str) -> int:
+    """The length Telegram counts, in UTF-16 code units. Measured on the
+    HTML, it is never less than that of the text the markup leaves."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+class ScoreboardRenderer:
+    """Turns ranked rows into scoreboard messages.
+
+    Rows are (rank, row) pairs, rows having user_id, name, username and days
+    attributes. Lines are
+    escaped once and cached by (user_id, name, username, days), so a
+    refresh where few streaks changed mostly joins cached strings.
+    """
+
+    def __init__(self, maxsize: int = 100000) -> None:
+        self._lines = LRUCache(maxsize=maxsize, ttl=float("inf"))
+
+    @property
+    def cache(self) -> LRUCache:
+        """The cache of escaped lines."""
+        return self._lines
+
+    def line(self, rank: int, row: Any) -> str:
+        key = (row.user_id, row.name, row.username, row.days)
+        line = self._lines.get(key)
+        if line is MISSING:
+            line = get_scoreboard_line(*key)
+            self._lines.set(key, line)
+        return f"{rank}. {line}"
+
+    def render(
+        self,
+        header: str,
+        rows: Sequence[Tuple[int, Any]],
+        limit: int = MESSAGE_LIMIT,
+    ) -> Tuple[str, int]:
+        """The header and as many leading rows as fit into `limit`, and the
+        number of rows that did."""
+        parts = [header]
+        length = text_length(header)
+        for count, (rank, row) in enumerate(rows):
+            line = self.line(rank, row)
+            length += text_length(line)
+            if length > limit:
+                return "".join(parts), count
+            parts.append(line)
+        return "".join(parts), len(rows)
+
+    def split(
+        self,
+        header: str,
+        rows: Sequence[Tuple[int, Any]],
+        limit: int = MESSAGE_LIMIT,
+    ) -> List[str]:
+        """All rows over as many messages as needed, the header on the first."""
+        messages = []
+        while True:
+            text, count = self.render(header, rows, limit)
+            if rows and not count:
+                raise ValueError(f"A scoreboard line is longer than {limit}")
+            messages.append(text)
+            rows = rows[count:]
+            if not rows:
+                return messages
+            header = ""
@@ -0,0 +1,59 @@
+from typing import Optional
+
+from aiogram.types import Message
+from kink import di
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.database import Users
+from services.cache import MISSING, LRUCache
+
+
+def remember_username(
+    user_id: int, old_username: Optional[str], new_username: Optional[str]
+) -> None:
+    """Keeps `di["usernames_cache"]` current when a username changes."""
+    usernames_cache: LRUCache = di["usernames_cache"]
+    if old_username:
+        usernames_cache.invalidate(old_username.lower())
+    if new_username:
+        usernames_cache.set(new_username.lower(), user_id)
+
+
+async def find_user_id_by_username(
+    session: AsyncSession, username: str
+) -> Optional[int]:
+    username = username.lower()
+    usernames_cache: LRUCache = di["usernames_cache"]
+    user_id = usernames_cache.get(username)
+    if user_id is MISSING:
+        # Served by ix_users_username_lower.
+        user_id = await session.scalar(
+            select(Users.user_id).where(func.lower(Users.username) == username).limit(1)
+        )
+        # Unknown usernames are not cached, they may register any moment.
+        if user_id is not None:
+            usernames_cache.set(username, user_id)
+    return user_id
+
+
+async def resolve_user_id(
+    session: AsyncSession, message: Message, argument: Optional[str]
+) -> Optional[int]:
+    """Finds the user an admin command is about.
+
+    Accepts a text mention, a numeric id or a @username as the argument,
+    and falls back to the author of the message being replied to. Returns
+    None if the user can't be found.
+    """
+    for entity in message.entities or ():
+        if entity.type == "text_mention" and entity.user is not None:
+            return entity.user.id
+    if argument:
+        argument = argument.strip()
+        if argument.isnumeric():
+            return int(argument)
+        return await find_user_id_by_username(session, argument.lstrip("@"))
+    if message.reply_to_message is not None and message.reply_to_message.from_user:
+        return message.reply_to_message.from_user.id
+    return None
@@ -0,0 +1,445 @@
+import asyncio
+import datetime
+import hashlib
+import heapq
+import itertools
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from aiogram.types import InlineKeyboardMarkup
+from kink import di
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.database import GroupUser, LiveScoreboard, Users
+from models.repository import delete_live_scoreboard, update_live_scoreboard
+from models.session import after_commit
+from models.sql import days_since
+from services.cluster import Shards
+from services.outbound import Priority, outbound_priority
+
+# Multiples of the golden ratio conjugate modulo 1 are spread almost evenly
+# over [0, 1), no matter how many scoreboards get registered.
+GOLDEN_RATIO_CONJUGATE = 0.6180339887498949
+
+PAGE_NEXT = "n"
+PAGE_PREVIOUS = "p"
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# (direction, streak, user_id): the page after or before that member.
+Cursor = Tuple[str, datetime.datetime, int]
+
+
+class Rendered(NamedTuple):
+    # When the content goes stale on its own, i.e. the day count of one of
+    # the members rolls over.
+    rollover_at: Optional[datetime.datetime]
+    content_hash: str
+
+
+# Called with the chat, the message, the page and the hash of what the
+# message shows now, so an unchanged scoreboard isn't edited.
+Refresh = Callable[[int, int, Optional[Cursor], Optional[str]], Awaitable[Rendered]]
+
+
+def content_hash(text: str, reply_markup: Optional[InlineKeyboardMarkup]) -> str:
+    markup = reply_markup.json() if reply_markup is not None else ""
+    return hashlib.sha256(f"{text}\0{markup}".encode()).hexdigest()
+
+
+@dataclass
+class ScoreboardEntry:
+    chat_id: int
+    message_id: int
+    phase: float
+    generation: int
+    cursor: Optional[Cursor] = None
+    running: bool = False
+    dirty: bool = True
+    rollover_at: Optional[datetime.datetime] = None
+    rendered_hash: Optional[str] = None
+
+    def is_stale(self, now: datetime.datetime) -> bool:
+        return self.dirty or (self.rollover_at is not None and now >= self.rollover_at)
+
+
+class ScoreboardScheduler:
+    """Refreshes every live scoreboard from a single timer heap.
+
+    Each scoreboard gets a fixed phase inside the refresh interval, so
+    refreshes are spread evenly instead of clustering around the moments
+    the buttons were clicked. At most `workers` refreshes run at once.
+
+    A tick only reaches the database and the Bot API when the scoreboard was
+    marked dirty by a write or one of its members' day count rolled over.
+
+    Scoreboards are kept in `live_scoreboard`; the handlers add them there
+    and the scheduler stores what it rendered and removes the ones whose
+    message is gone. `resume` picks them up after a restart. Only the
+    scoreboards of chats in `shards` owned by this process are refreshed.
+    """
+
+    def __init__(
+        self,
+        refresh: Refresh,
+        interval: float,
+        workers: int = 4,
+        shards: Optional[Shards] = None,
+    ) -> None:
+        self._refresh = refresh
+        self._shards = shards or Shards()
+        self._interval = interval
+        self._workers_count = workers
+        self._entries: Dict[int, ScoreboardEntry] = {}
+        self._heap: List[Tuple[float, int, int, int]] = []
+        self._sequence = itertools.count()
+        self._phases = itertools.count()
+        self._generations = itertools.count()
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        # Written to live_scoreboard by the workers, see `_store`.
+        self._rendered: Dict[Tuple[int, int], Rendered] = {}
+        self._removed: List[Tuple[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._entries
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self._workers_count)
+        self._wakeup = asyncio.Event()
+        self._tasks.append(asyncio.create_task(self._dispatch()))
+        for _ in range(self._workers_count):
+            self._tasks.append(asyncio.create_task(self._work()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        await self._store()
+
+    async def resume(self, session: AsyncSession) -> None:
+        """Loads the scoreboards of the owned shards from `live_scoreboard`.
+
+        Writes may have happened since they were rendered, so every new one
+        is refreshed once, at its own phase rather than all at once. Edits
+        that would change nothing are skipped by the rendered hash.
+
+        Called again whenever the owned shards may have changed, it also
+        drops the scoreboards that went to other processes.
+        """
+        rows = (
+            await session.scalars(
+                select(LiveScoreboard).where(self._shards.where(LiveScoreboard.chat_id))
+            )
+        ).all()
+        now = time.monotonic()
+        resumed = 0
+        for row in rows:
+            entry = self._entries.get(row.chat_id)
+            if entry is not None:
+                if entry.message_id != row.message_id:
+                    self.replace(row.chat_id, row.message_id)
+                # Writes handled by other processes don't mark it dirty.
+                entry.dirty = entry.dirty or self._shards.clustered
+                continue
+            entry = self._add(row.chat_id, row.message_id)
+            entry.rendered_hash = row.last_rendered_hash
+            entry.rollover_at = row.next_due
+            self._schedule(entry, self._next_due(entry, now))
+            resumed += 1
+        live = {row.chat_id for row in rows}
+        for chat_id in [chat_id for chat_id in self._entries if chat_id not in live]:
+            del self._entries[chat_id]
+        if resumed:
+            logging.info("Resumed %d live scoreboards", resumed)
+
+    async def sync(self) -> None:
+        session: AsyncSession
+        async with di["async_session"]() as session:
+            await self.resume(session)
+
+    def register(self, chat_id: int, message_id: int) -> bool:
+        """Makes `message_id` the live scoreboard of `chat_id` and renders it
+        right away. A previous scoreboard of the same chat stops refreshing.
+
+        Returns False if another process refreshes the scoreboards of the
+        chat; it picks the new one up on its next lease round.
+        """
+        if not self._shards.owns(chat_id):
+            return False
+        if not self.replace(chat_id, message_id):
+            self._schedule(self._add(chat_id, message_id), time.monotonic())
+        return True
+
+    def _add(self, chat_id: int, message_id: int) -> ScoreboardEntry:
+        phase = (next(self._phases) * GOLDEN_RATIO_CONJUGATE) % 1 * self._interval
+        entry = ScoreboardEntry(
+            chat_id=chat_id,
+            message_id=message_id,
+            phase=phase,
+            generation=next(self._generations),
+        )
+        self._entries[chat_id] = entry
+        return entry
+
+    def replace(self, chat_id: int, message_id: int) -> bool:
+        """Swaps the message of an existing scoreboard, keeping its phase.
+        Returns False if the chat has no live scoreboard."""
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            return False
+        entry.message_id = message_id
+        entry.cursor = None
+        entry.dirty = True
+        entry.rendered_hash = None
+        entry.generation = next(self._generations)
+        self._schedule(entry, time.monotonic())
+        return True
+
+    def set_cursor(
+        self,
+        chat_id: int,
+        message_id: int,
+        cursor: Optional[Cursor],
+        rendered_hash: Optional[str] = None,
+    ) -> None:
+        """Remembers the page a live scoreboard was switched to."""
+        entry = self._entries.get(chat_id)
+        if entry is not None and entry.message_id == message_id:
+            entry.cursor = cursor
+            entry.rendered_hash = rendered_hash
+
+    def mark_dirty(self, *chat_ids: int) -> None:
+        for chat_id in chat_ids:
+            entry = self._entries.get(chat_id)
+            if entry is not None:
+                entry.dirty = True
+
+    def unregister(self, chat_id: int, message_id: Optional[int] = None) -> None:
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            return
+        if message_id is not None and entry.message_id != message_id:
+            return
+        del self._entries[chat_id]
+        self._removed.append((chat_id, entry.message_id))
+
+    def _next_due(self, entry: ScoreboardEntry, now: float) -> float:
+        periods = math.floor((now - entry.phase) / self._interval) + 1
+        return entry.phase + periods * self._interval
+
+    def _schedule(self, entry: ScoreboardEntry, due: float) -> None:
+        heapq.heappush(
+            self._heap, (due, next(self._sequence), entry.chat_id, entry.generation)
+        )
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _dispatch(self) -> None:
+        while True:
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            due, _, chat_id, generation = self._heap[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            entry = self._entries.get(chat_id)
+            if entry is None or entry.generation != generation:
+                continue
+            # Never refresh twice within half an interval, e.g. right after
+            # the immediate render of a freshly registered scoreboard.
+            self._schedule(
+                entry, self._next_due(entry, time.monotonic() + self._interval / 2)
+            )
+            if entry.running or not entry.is_stale(datetime.datetime.now()):
+                continue
+            if not self._shards.owns(chat_id):
+                continue
+            entry.running = True
+            await self._queue.put(entry)
+
+    async def _work(self) -> None:
+        outbound_priority.set(Priority.BACKGROUND)
+        while True:
+            entry = await self._queue.get()
+            # Cleared before the refresh, so writes that land while it runs
+            # mark the scoreboard dirty again.
+            entry.dirty = False
+            chat_id, message_id = entry.chat_id, entry.message_id
+            try:
+                rendered = await self._refresh(
+                    chat_id, message_id, entry.cursor, entry.rendered_hash
+                )
+                if rendered != (entry.rollover_at, entry.rendered_hash):
+                    self._rendered[chat_id, message_id] = rendered
+                entry.rollover_at, entry.rendered_hash = rendered
+                await self._store()
+            except Exception:
+                entry.dirty = True
+                logging.exception(
+                    "Failed to refresh scoreboard %d/%d",
+                    entry.chat_id,
+                    entry.message_id,
+                )
+            finally:
+                entry.running = False
+                self._queue.task_done()
+
+    async def _store(self) -> None:
+        """Writes what was rendered and removed since the last call."""
+        if not self._rendered and not self._removed:
+            return
+        rendered, self._rendered = self._rendered, {}
+        removed, self._removed = self._removed, []
+        session: AsyncSession
+        try:
+            async with di["async_session"]() as session:
+                for (chat_id, message_id), (
+                    rollover_at,
+                    rendered_hash,
+                ) in rendered.items():
+                    await update_live_scoreboard(
+                        session, chat_id, message_id, rendered_hash, rollover_at
+                    )
+                for chat_id, message_id in removed:
+                    await delete_live_scoreboard(session, chat_id, message_id)
+                await session.commit()
+        except Exception:
+            self._rendered = {**rendered, **self._rendered}
+            self._removed[:0] = removed
+            raise
+
+
+async def mark_scoreboards_dirty(session: AsyncSession, user_id: int) -> None:
+    """Marks the scoreboards of every group `user_id` takes part in dirty,
+    once the transaction of `session` commits."""
+    scheduler: ScoreboardScheduler = di["scoreboard_scheduler"]
+    if not len(scheduler):
+        return
+    group_ids = (
+        await session.scalars(
+            select(GroupUser.group_id).where(GroupUser.user_id == user_id)
+        )
+    ).all()
+    after_commit(session, lambda: scheduler.mark_dirty(*group_ids))
+
+
+def encode_cursor(direction: str, streak: datetime.datetime, user_id: int) -> str:
+    microseconds = (streak - EPOCH) // datetime.timedelta(microseconds=1)
+    return f"sb_{direction}_{microseconds}_{user_id}"
+
+
+def decode_cursor(data: str) -> Cursor:
+    _, direction, microseconds, user_id = data.split("_")
+    streak = EPOCH + datetime.timedelta(microseconds=int(microseconds))
+    return direction, streak, int(user_id)
+
+
+class ScoreboardRow(NamedTuple):
+    user_id: int
+    name: str
+    username: Optional[str]
+    streak: datetime.datetime
+    days: int
+    rank: int
+
+
+@dataclass
+class ScoreboardPage:
+    rows: Sequence[ScoreboardRow]
+    has_previous: bool
+    has_next: bool
+
+
+async def fetch_scoreboard_page(
+    session: AsyncSession,
+    chat_id: int,
+    cursor: Optional[Cursor],
+    page_size: int,
+    now: datetime.datetime,
+) -> ScoreboardPage:
+    """One page of a group's scoreboard.
+
+    Pages are addressed by the (streak, user_id) of a neighbouring member
+    rather than an offset: the page is read in `ix_users_streak` order
+    starting at the cursor. The rank of its first row is the number of
+    members before it, the others follow on from there.
+    """
+    members = (
+        select()
+        .select_from(Users)
+        .join(GroupUser, Users.user_id == GroupUser.user_id)
+        .where(
+            GroupUser.group_id == chat_id,
+            GroupUser.is_banned == False,
+            GroupUser.has_left == False,
+        )
+    )
+    key = tuple_(Users.streak, Users.user_id)
+    query = members.add_columns(
+        Users.user_id,
+        Users.name,
+        Users.username,
+        Users.streak,
+        days_since(Users.streak, now).label("days"),
+    ).limit(page_size + 1)
+    if cursor is not None and cursor[0] == PAGE_PREVIOUS:
+        rows = (
+            await session.execute(
+                query.where(key < tuple_(cursor[1], cursor[2])).order_by(
+                    Users.streak.desc(), Users.user_id.desc()
+                )
+            )
+        ).all()
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_next = True
+    else:
+        if cursor is not None:
+            query = query.where(key > tuple_(cursor[1], cursor[2]))
+        rows = (
+            await session.execute(query.order_by(Users.streak, Users.user_id))
+        ).all()
+        has_previous = cursor is not None
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+    first_rank = 1
+    if rows and has_previous:
+        first_rank += await session.scalar(
+            members.add_columns(func.count()).where(
+                key < tuple_(rows[0].streak, rows[0].user_id)
+            )
+        )
+    return ScoreboardPage(
+        rows=[
+            ScoreboardRow(*row, rank=first_rank + index)
+            for index, row in enumerate(rows)
+        ],
+        has_previous=has_previous,
+        has_next=has_next,
+    )
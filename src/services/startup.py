@@ -0,0 +1,21 @@
+import time
+from typing import List, Tuple
+
+
+class StartupTimer:
+    """How long each step of the startup took, for the log."""
+
+    def __init__(self, started: float) -> None:
+        self._started = started
+        self._last = started
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str) -> None:
+        """Ends `phase`, which began where the previous one ended."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self) -> str:
+        steps = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in self.phases)
+        return f"Started in {self._last - self._started:.3f}s ({steps})"
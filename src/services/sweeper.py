@@ -0,0 +1,198 @@
+import asyncio
+import datetime
+import enum
+import logging
+from typing import List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.types import User
+from kink import di
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.database import GroupUser, JobCheckpoint
+from models.repository import delete_users, save_checkpoint, set_has_left
+from models.session import after_commit
+from services.cluster import Shards
+from services.leaderboard import sync_global_leaderboard
+from services.outbound import Priority, TokenBucket, outbound_priority
+from services.scoreboards import mark_scoreboards_dirty
+
+JOB_NAME = "account_sweeper"
+
+
+class Membership(enum.Enum):
+    PRESENT = "present"
+    LEFT = "left"
+    DELETED = "deleted"
+
+
+def is_deleted_account(user: User) -> bool:
+    return user.first_name in ("", "Deleted Account")
+
+
+class AccountSweeper:
+    """Finds deleted accounts and members that left, one batch at a time.
+
+    Walks `group_user` in (group_id, user_id) order and asks Telegram about
+    each membership, never faster than `rate` requests per second. Deleted
+    accounts are erased, members that left are hidden from the scoreboard
+    until they come back. The position is saved in `job_checkpoint` after
+    every batch, so a restart continues where the last run stopped.
+
+    Only the groups of the owned `shards` are swept, each shard with a
+    checkpoint of its own.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        rate: float,
+        batch_size: int = 100,
+        interval: float = 86400,
+        retry_delay: float = 60,
+        shards: Optional[Shards] = None,
+    ) -> None:
+        self._bot = bot
+        self._shards = shards or Shards()
+        self._budget = TokenBucket(rate, 1)
+        self._batch_size = batch_size
+        self._interval = datetime.timedelta(seconds=interval)
+        self._retry_delay = retry_delay
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        outbound_priority.set(Priority.BACKGROUND)
+        while True:
+            try:
+                timeout = await self._sweep_batch()
+            except Exception:
+                logging.exception("Failed to sweep accounts")
+                timeout = self._retry_delay
+            if timeout > 0:
+                await asyncio.sleep(timeout)
+
+    async def _sweep_batch(self) -> float:
+        """Probes one batch of memberships of every owned shard and returns
+        how long to sleep."""
+        timeouts = [
+            await self._sweep_shard(shard) for shard in sorted(self._shards.owned)
+        ]
+        return min(timeouts, default=self._retry_delay)
+
+    def _checkpoint_name(self, shard: int) -> str:
+        if self._shards.count == 1:
+            return JOB_NAME
+        return f"{JOB_NAME}:{shard}"
+
+    async def _sweep_shard(self, shard: int) -> float:
+        now = datetime.datetime.now()
+        name = self._checkpoint_name(shard)
+        session: AsyncSession
+        async with di["async_session"]() as session:
+            checkpoint = await session.get(JobCheckpoint, name)
+            query = (
+                select(GroupUser.group_id, GroupUser.user_id)
+                .order_by(GroupUser.group_id, GroupUser.user_id)
+                .limit(self._batch_size)
+            )
+            if self._shards.count > 1:
+                query = query.where(
+                    func.abs(GroupUser.group_id) % self._shards.count == shard
+                )
+            if checkpoint is not None and checkpoint.group_id is not None:
+                query = query.where(
+                    tuple_(GroupUser.group_id, GroupUser.user_id)
+                    > tuple_(checkpoint.group_id, checkpoint.user_id)
+                )
+            elif checkpoint is not None and checkpoint.finished_at is not None:
+                next_pass = checkpoint.finished_at + self._interval
+                if next_pass > now:
+                    return (next_pass - now).total_seconds()
+            members = (await session.execute(query)).all()
+
+        # No connection is held while waiting for the rate budget.
+        deleted: Set[int] = set()
+        left: List[Tuple[int, int]] = []
+        present: List[Tuple[int, int]] = []
+        for group_id, user_id in members:
+            if user_id in deleted:
+                continue
+            membership = await self._probe(group_id, user_id)
+            if membership is Membership.DELETED:
+                deleted.add(user_id)
+            elif membership is Membership.LEFT:
+                left.append((group_id, user_id))
+            elif membership is Membership.PRESENT:
+                present.append((group_id, user_id))
+
+        finished = len(members) < self._batch_size
+        async with di["async_session"]() as session:
+            if deleted:
+                await self._delete(session, deleted)
+            changed = await set_has_left(session, left, True)
+            changed += await set_has_left(session, present, False)
+            for user_id in {user_id for _, user_id in changed}:
+                await sync_global_leaderboard(session, user_id)
+            if changed:
+                group_ids = {group_id for group_id, _ in changed}
+                after_commit(
+                    session,
+                    lambda: di["scoreboard_scheduler"].mark_dirty(*group_ids),
+                )
+            if finished:
+                await save_checkpoint(
+                    session, name, None, None, datetime.datetime.now()
+                )
+            else:
+                group_id, user_id = members[-1]
+                await save_checkpoint(session, name, group_id, user_id, None)
+            await session.commit()
+        if deleted or changed:
+            logging.info(
+                "Account sweep: %d deleted accounts, %d membership changes",
+                len(deleted),
+                len(changed),
+            )
+        return self._interval.total_seconds() if finished else 0
+
+    async def _delete(self, session: AsyncSession, user_ids: Set[int]) -> None:
+        for user_id in user_ids:
+            await mark_scoreboards_dirty(session, user_id)
+        await delete_users(session, list(user_ids))
+
+        def forget() -> None:
+            for user_id in user_ids:
+                di["global_ranking"].discard(user_id)
+                di["users_cache"].invalidate(user_id)
+
+        after_commit(session, forget)
+
+    async def _probe(self, group_id: int, user_id: int) -> Optional[Membership]:
+        """Asks Telegram about a membership. None if it can't be told."""
+        while True:
+            await self._budget.acquire()
+            try:
+                member = await self._bot.get_chat_member(group_id, user_id)
+            except TelegramRetryAfter as e:
+                self._budget.block(e.retry_after)
+                continue
+            except TelegramAPIError:
+                # The bot was removed from the group or the chat is gone.
+                return None
+            if is_deleted_account(member.user):
+                return Membership.DELETED
+            if member.status in ("left", "kicked"):
+                return Membership.LEFT
+            return Membership.PRESENT
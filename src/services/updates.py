@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+Process = Callable[[Update], Awaitable[None]]
+
+
+def chat_key(update: Update) -> Hashable:
+    """Updates sharing a key are processed one after another, in order."""
+    if update.message:
+        return update.message.chat.id
+    if update.edited_message:
+        return update.edited_message.chat.id
+    if update.callback_query:
+        if update.callback_query.message:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    if update.my_chat_member:
+        return update.my_chat_member.chat.id
+    if update.chat_member:
+        return update.chat_member.chat.id
+    # Nothing to keep in order with, let it run in parallel with anything.
+    return ("update", update.update_id)
+
+
+class UpdateScheduler:
+    """Processes updates with a fixed number of workers.
+
+    Updates of the same chat wait in a FIFO and are never processed
+    concurrently, while different chats are served round-robin. Once
+    `max_pending` updates are queued or running, `submit` blocks, so a burst
+    slows down the intake instead of exhausting the database pool.
+    """
+
+    def __init__(self, process: Process, workers: int, max_pending: int) -> None:
+        self._process = process
+        self._workers_count = workers
+        self._max_pending = max_pending
+        self._chats: Dict[Hashable, Deque[Update]] = {}
+        self._scheduled: Set[Hashable] = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._capacity: Optional[asyncio.Semaphore] = None
+        self._tasks: List[asyncio.Task] = []
+        self.pending = 0
+        self.in_flight = 0
+        self.max_pending_seen = 0
+
+    @property
+    def chats_waiting(self) -> int:
+        return len(self._chats)
+
+    async def start(self) -> None:
+        self._ready = asyncio.Queue()
+        self._capacity = asyncio.Semaphore(self._max_pending)
+        for _ in range(self._workers_count):
+            self._tasks.append(asyncio.create_task(self._work()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def submit(self, update: Update) -> None:
+        await self._capacity.acquire()
+        key = chat_key(update)
+        self._chats.setdefault(key, deque()).append(update)
+        self.pending += 1
+        self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            self._ready.put_nowait(key)
+
+    async def _work(self) -> None:
+        while True:
+            key = await self._ready.get()
+            queue = self._chats[key]
+            update = queue.popleft()
+            self.pending -= 1
+            self.in_flight += 1
+            try:
+                await self._process(update)
+            except Exception:
+                logging.exception("Failed to process update %d", update.update_id)
+            finally:
+                self.in_flight -= 1
+                self._capacity.release()
+                if queue:
+                    # Back of the line, so one busy chat can't starve others.
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                    self._scheduled.discard(key)
+
+
+async def poll_updates(
+    dp: Dispatcher,
+    bot: Bot,
+    scheduler: UpdateScheduler,
+    polling_timeout: int = 30,
+    max_backoff: float = 30,
+) -> None:
+    """Long polling that hands every update over to `scheduler`."""
+    allowed_updates = dp.resolve_used_update_types()
+    offset = None
+    backoff = 1.0
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset,
+                timeout=polling_timeout,
+                allowed_updates=allowed_updates,
+            )
+        except Exception:
+            logging.exception("Failed to fetch updates, retrying in %.0fs", backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff)
+            continue
+        backoff = 1.0
+        for update in updates:
+            await scheduler.submit(update)
+            offset = update.update_id + 1
@@ -0,0 +1,71 @@
+import asyncio
+import hmac
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from services.updates import UpdateScheduler
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Receives updates over HTTP and answers before they are processed.
+
+    Accepted updates are handed over to the `UpdateScheduler`. Requests only
+    wait when its backlog is full, which makes Telegram slow down instead of
+    piling up work.
+    """
+
+    def __init__(self, scheduler: UpdateScheduler, secret_token: str) -> None:
+        self._scheduler = scheduler
+        self._secret_token = secret_token
+
+    def create_app(self, path: str) -> web.Application:
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        # Without it anyone who knows the URL could post updates on behalf
+        # of any user, anonymous group admins included.
+        if not hmac.compare_digest(
+            request.headers.get(SECRET_TOKEN_HEADER, "").encode(),
+            self._secret_token.encode(),
+        ):
+            return web.Response(status=401)
+        try:
+            update = Update(**await request.json())
+        except (TypeError, ValueError):
+            return web.Response(status=400)
+        await self._scheduler.submit(update)
+        return web.Response()
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    url: str,
+    path: str,
+    host: str,
+    port: int,
+    secret_token: str,
+    scheduler: UpdateScheduler,
+) -> None:
+    server = WebhookServer(scheduler, secret_token)
+    runner = web.AppRunner(server.create_app(path))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    await bot.set_webhook(
+        url + path,
+        secret_token=secret_token,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=True,
+    )
+    logging.info("Listening for webhook updates on %s:%d%s", host, port, path)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
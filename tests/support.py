@@ -0,0 +1,116 @@
+"""Runs updates through the dispatcher with all middlewares, on a scratch
+SQLite database and the fake Bot API."""
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+import unittest
+from typing import Any, Dict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+# Removed when the interpreter exits.
+DATA = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DATA.name}/streak.db"
+os.environ["TOKEN"] = "123456:test"
+os.environ["METRICS_PORT"] = "0"
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+from kink import di
+from sqlalchemy import func, select
+
+import main
+from fake_bot_api import BOT_ID, FakeBotAPI, make_chat, make_user
+from models.database import Users
+from models.schema import prepare_schema
+from services.autodelete import DeletionQueue
+from services.leaderboard import GlobalRanking
+from services.scoreboards import ScoreboardScheduler
+
+CHAT_ID = -1001
+
+_ids = itertools.count(1)
+
+
+def message(user_id: int, chat_id: int, text: str) -> Update:
+    return Update(
+        update_id=next(_ids),
+        message={
+            "message_id": next(_ids),
+            "date": int(time.time()),
+            "chat": make_chat(chat_id),
+            "from": make_user(user_id),
+            "text": text,
+        },
+    )
+
+
+def callback(user_id: int, chat_id: int, data: str) -> Update:
+    return Update(
+        update_id=next(_ids),
+        callback_query={
+            "id": str(next(_ids)),
+            "from": make_user(user_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": next(_ids),
+                "date": int(time.time()),
+                "chat": make_chat(chat_id),
+                "from": make_user(BOT_ID, is_bot=True),
+                "text": "",
+            },
+        },
+    )
+
+
+class BotTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        await prepare_schema(di["engine"])
+        self.api = FakeBotAPI()
+        await self.api.start()
+        self.bot = Bot(
+            "123456:test",
+            parse_mode="HTML",
+            session=AiohttpSession(api=TelegramAPIServer.from_base(self.api.url)),
+        )
+        di["global_ranking"] = GlobalRanking()
+        # Not started, nothing is refreshed or deleted in the background.
+        di["scoreboard_scheduler"] = ScoreboardScheduler(refresh=None, interval=60)
+        di["deletion_queue"] = DeletionQueue(self.bot, delay=0)
+        di["users_cache"].clear()
+        di["groups_cache"].clear()
+        self.user_id = 10_000 + next(_ids)
+
+    async def asyncTearDown(self) -> None:
+        await self.bot.session.close()
+        await self.api.stop()
+        # Pooled aiosqlite connections belong to this test's event loop.
+        await di["engine"].dispose()
+
+    async def feed(self, *updates: Update) -> None:
+        results = await asyncio.gather(
+            *(main.dp.feed_update(self.bot, update) for update in updates),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def count(self, *where: Any) -> int:
+        async with di["async_session"]() as session:
+            return await session.scalar(select(func.count()).where(*where))
+
+    async def user(self) -> Dict[str, Any]:
+        async with di["async_session"]() as session:
+            user = await session.scalar(
+                select(Users).where(Users.user_id == self.user_id)
+            )
+            return {"attempts": user.attempts, "streak": user.streak}
@@ -0,0 +1,88 @@
+"""Concurrent updates of the same user and chat.
+
+    $ python -m unittest discover tests
+"""
+import unittest
+
+# Sets the environment up before the bot's modules are imported.
+from support import CHAT_ID, BotTestCase, callback, message
+
+# isort: split
+from kink import di
+
+from models.database import Group, GroupUser, RelapseEvent, Users
+
+PARALLEL = 10
+ROUNDS = 5
+
+
+class ConcurrentUpdatesTest(BotTestCase):
+    async def test_parallel_streak_and_enablescoreboard(self) -> None:
+        await self.feed(
+            *(message(self.user_id, CHAT_ID, "/streak") for _ in range(PARALLEL))
+        )
+        await self.feed(
+            *(
+                message(self.user_id, CHAT_ID, "/enablescoreboard")
+                for _ in range(PARALLEL)
+            )
+        )
+        self.assertEqual(await self.count(Users.user_id == self.user_id), 1)
+        self.assertEqual(await self.count(Group.group_id == CHAT_ID), 1)
+        self.assertEqual(
+            await self.count(
+                GroupUser.group_id == CHAT_ID, GroupUser.user_id == self.user_id
+            ),
+            1,
+        )
+        self.assertEqual(di["global_ranking"].rank(self.user_id), 1)
+
+    async def test_double_clicked_relapse_counts_once(self) -> None:
+        await self.feed(message(self.user_id, CHAT_ID, "/streak"))
+        for attempt in range(1, ROUNDS + 1):
+            await self.feed(
+                *(
+                    callback(self.user_id, CHAT_ID, f"relapse_{self.user_id}_{attempt}")
+                    for _ in range(PARALLEL)
+                )
+            )
+            self.assertEqual((await self.user())["attempts"], attempt + 1)
+        self.assertEqual(await self.count(RelapseEvent.user_id == self.user_id), ROUNDS)
+
+    async def test_parallel_relapses_all_count(self) -> None:
+        await self.feed(message(self.user_id, CHAT_ID, "/streak"))
+        # Buttons without an attempt number register every click.
+        await self.feed(
+            *(
+                callback(self.user_id, CHAT_ID, f"relapse_{self.user_id}")
+                for _ in range(PARALLEL)
+            )
+        )
+        self.assertEqual((await self.user())["attempts"], 1 + PARALLEL)
+        self.assertEqual(
+            await self.count(RelapseEvent.user_id == self.user_id), PARALLEL
+        )
+
+    async def test_mixed_updates(self) -> None:
+        await self.feed(message(self.user_id, CHAT_ID, "/streak"))
+        updates = []
+        for _ in range(PARALLEL):
+            updates.append(message(self.user_id, CHAT_ID, "/streak"))
+            updates.append(message(self.user_id, CHAT_ID, "/enablescoreboard"))
+            updates.append(callback(self.user_id, CHAT_ID, f"relapse_{self.user_id}"))
+        await self.feed(*updates)
+        self.assertEqual((await self.user())["attempts"], 1 + PARALLEL)
+        self.assertEqual(
+            await self.count(RelapseEvent.user_id == self.user_id), PARALLEL
+        )
+        self.assertEqual(
+            await self.count(
+                GroupUser.group_id == CHAT_ID, GroupUser.user_id == self.user_id
+            ),
+            1,
+        )
+        self.assertEqual(await self.count(Group.group_id == CHAT_ID), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+"""No pooled connection is held while a handler talks to the Bot API.
+
+    $ python -m unittest discover tests
+"""
+import unittest
+from typing import Any, List
+
+# Sets the environment up before the bot's modules are imported.
+from support import CHAT_ID, BotTestCase, callback, message
+
+# isort: split
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import TelegramMethod
+from kink import di
+
+
+class CheckedOutConnections(BaseRequestMiddleware):
+    """Records how many connections are checked out at every Bot API call."""
+
+    def __init__(self) -> None:
+        self.seen: List[Any] = []
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Any:
+        self.seen.append(
+            (
+                type(method).__name__,
+                getattr(method, "text", None),
+                di["engine"].pool.checkedout(),
+            )
+        )
+        return await make_request(bot, method)
+
+
+class ConnectionsTest(BotTestCase):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.connections = CheckedOutConnections()
+        self.bot.session.middleware(self.connections)
+
+    async def assert_released(self, *updates: Any) -> None:
+        # One at a time, so no other update holds a connection meanwhile.
+        for update in updates:
+            await self.feed(update)
+        self.assertTrue(self.connections.seen)
+        self.assertEqual(
+            [seen for seen in self.connections.seen if seen[-1]],
+            [],
+            "Connections checked out during Bot API calls",
+        )
+
+    async def test_private_commands(self) -> None:
+        await self.assert_released(
+            *(
+                message(self.user_id, self.user_id, text)
+                for text in (
+                    "/start",
+                    "/streak",
+                    "/streak",
+                    "/stats",
+                    "/history",
+                    "/top",
+                    "/help",
+                    "/relapse",
+                    "/milestones",
+                )
+            ),
+            callback(self.user_id, self.user_id, f"relapse_{self.user_id}_1"),
+        )
+
+    async def test_group_commands(self) -> None:
+        await self.assert_released(
+            *(
+                message(self.user_id, CHAT_ID, text)
+                for text in (
+                    "/streak",
+                    "/enablescoreboard",
+                    "/enablescoreboard",
+                    "/stats",
+                    "/top",
+                    "/relapse",
+                    "hello",
+                )
+            ),
+            callback(self.user_id, CHAT_ID, f"relapse_{self.user_id}_1"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()